@@ -0,0 +1,141 @@
+"""幻灯片视图模型内存基准
+
+对比旧的逐页字典（含块结构字典树和 retrieve_structure 的 page_meta 字典列表）
+与 SlideView/ChunkView/PageMeta 在同时持有全部幻灯片模型时的内存占用。每种实现在独立子进程中运行，
+报告每 1000 张幻灯片的峰值 RSS 增量和 tracemalloc 峰值。
+
+    python bench_slide_model.py --slides 1000 5000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+SECTION = """## 第{i}节 机器学习主要类型
+
+### 监督学习 {i}
+- 使用标记数据进行训练
+- 常见算法：线性回归、决策树、支持向量机
+- 应用：分类和回归问题
+
+===
+
+```python
+def predict(x):
+    return model.predict(x)  # {i}
+```
+
+---
+"""
+
+
+def build_document(slides):
+    # 每节拆分为 1 页（h2 + h3 在同一页），加上标题页
+    return "# 基准测试文档\n\n" + "\n".join(SECTION.format(i=i) for i in range(slides))
+
+
+def legacy_models(pages):
+    """旧实现：每页一个字典，复制标题并构造块结构字典树，page_meta 为字典列表"""
+    from moffee_tool_v1 import prerender_blocks
+
+    def chunk_dict(chunk):
+        return {
+            "type": chunk.type,
+            "direction": chunk.direction,
+            "alignment": chunk.alignment,
+            "paragraph": prerender_blocks(chunk.paragraph),
+            "children": [chunk_dict(child) for child in chunk.children or []],
+        }
+
+    page_meta = []
+    current_h1 = current_h2 = current_h3 = None
+    for page in pages:
+        if page.h1 and page.h1 != current_h1:
+            current_h1, current_h2, current_h3 = page.h1, None, None
+        if page.h2 and page.h2 != current_h2:
+            current_h2, current_h3 = page.h2, None
+        if page.h3 and page.h3 != current_h3:
+            current_h3 = page.h3
+        page_meta.append({"h1": current_h1, "h2": current_h2, "h3": current_h3})
+    slides = [
+        {
+            "h1": page.h1,
+            "h2": page.h2,
+            "h3": page.h3,
+            "chunk": chunk_dict(page.chunk),
+            "layout": page.option.layout if hasattr(page.option, 'layout') else 'content',
+            "styles": getattr(page.option, 'styles', {}),
+        }
+        for page in pages
+    ]
+    return slides, page_meta
+
+
+def compact_models(pages):
+    """新实现：SlideView + PageMeta，访问块结构时才构造"""
+    from moffee_tool_v1 import SlideView, retrieve_structure
+
+    slides = [SlideView(page) for page in pages]
+    for slide in slides:
+        slide.chunk  # 与旧实现一样持有全部块结构，公平比较
+    return slides, retrieve_structure(pages)["page_meta"]
+
+
+def run_variant(variant, slides):
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from moffee_tool_v1 import composite, prerender_blocks
+
+    # 使用不带缓存的 composite，两种实现的页面构造开销相同
+    pages = composite(build_document(slides))
+    # 预渲染结果本身两种实现相同，先填充代码块缓存并加载词法分析器，只比较模型结构
+    for page in pages:
+        prerender_blocks(page.chunk.paragraph)
+        for child in page.chunk.children or []:
+            prerender_blocks(child.paragraph)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    models = (legacy_models if variant == "legacy" else compact_models)(pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss 在 Linux 上单位为 KB，macOS 上为字节
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    print(json.dumps({
+        "variant": variant,
+        "pages": len(pages),
+        "models": len(models[0]),
+        "tracemalloc_peak_bytes": peak,
+        "rss_delta_bytes": (peak_rss - baseline_rss) * rss_unit,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="幻灯片视图模型内存基准")
+    parser.add_argument("--slides", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--variant", choices=["legacy", "compact"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.slides[0])
+        return
+
+    print(f"{'slides':>8} {'variant':>8} {'tracemalloc/1k':>16} {'peak RSS/1k':>14}")
+    for slides in args.slides:
+        for variant in ("legacy", "compact"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--slides", str(slides)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            per_k = 1000 / max(result["pages"], 1)
+            print(f"{result['pages']:>8} {variant:>8} "
+                  f"{result['tracemalloc_peak_bytes'] * per_k / 1024:>13.1f} KB "
+                  f"{result['rss_delta_bytes'] * per_k / 1024:>11.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
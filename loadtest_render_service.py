@@ -0,0 +1,121 @@
+"""渲染服务压测脚本
+
+先启动服务：python render_service.py --port 8765
+再运行：    python loadtest_render_service.py --concurrency 16 --requests 500
+
+每个并发连接使用 HTTP keep-alive 循环发送 /render 请求，统计吞吐量、
+状态码分布以及 p50/p99 延迟。--unique 让每个请求内容不同，绕过结果缓存；
+--conditional 在拿到 ETag 后携带 If-None-Match，测试 304 路径。
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+
+def percentile(values, q):
+    """最近秩法求分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def build_payload(args, index):
+    if args.markdown_file:
+        with open(args.markdown_file, encoding="utf-8") as f:
+            payload = {"markdown": f.read(), "theme": args.theme}
+    else:
+        payload = {"topic": args.topic, "num_slides": args.num_slides, "theme": args.theme}
+    if args.unique:
+        key = "markdown" if "markdown" in payload else "topic"
+        payload[key] = f"{payload[key]}\n\n<!-- {index} -->" if key == "markdown" else f"{payload[key]} #{index}"
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def run_client(args, url, counter, lock, results):
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=args.timeout)
+    etag = None
+    while True:
+        with lock:
+            if counter[0] >= args.requests:
+                break
+            index = counter[0]
+            counter[0] += 1
+        headers = {"Content-Type": "application/json"}
+        if args.conditional and etag:
+            headers["If-None-Match"] = etag
+        body = build_payload(args, index)
+        started = time.perf_counter()
+        try:
+            connection.request("POST", "/render", body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            etag = response.getheader("ETag") or etag
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            status = "error"
+            connection.close()
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((status, elapsed))
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="渲染服务压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--topic", default="人工智能发展趋势")
+    parser.add_argument("--num-slides", type=int, default=5)
+    parser.add_argument("--markdown-file", default=None, help="使用指定 Markdown 文件作为请求内容")
+    parser.add_argument("--theme", default="default")
+    parser.add_argument("--unique", action="store_true", help="每个请求内容不同，绕过服务端缓存")
+    parser.add_argument("--conditional", action="store_true", help="携带 If-None-Match 发送条件请求")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    counter, lock, results = [0], threading.Lock(), []
+    threads = [
+        threading.Thread(target=run_client, args=(args, url, counter, lock, results))
+        for _ in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    statuses = Counter(str(status) for status, _ in results)
+    ok_latencies = [elapsed for status, elapsed in results if status in (200, 304)]
+    report = {
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(results) / duration, 2) if duration else 0.0,
+        "status": dict(statuses),
+        "p50_ms": round(percentile(ok_latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(ok_latencies, 99) * 1000, 2),
+        "max_ms": round(max(ok_latencies) * 1000, 2) if ok_latencies else float("nan"),
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"请求数: {report['requests']}  并发: {report['concurrency']}  耗时: {report['duration_s']}s")
+    print(f"吞吐量: {report['throughput_rps']} req/s")
+    print("状态码: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    print(f"延迟 (200/304): p50={report['p50_ms']}ms  p99={report['p99_ms']}ms  max={report['max_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
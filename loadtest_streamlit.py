@@ -0,0 +1,395 @@
+"""Streamlit 界面多会话并发压测
+
+用 streamlit run 在子进程中启动应用，每个模拟会话在自己的线程里通过 WebSocket 连接服务器，
+像浏览器前端一样发送控件状态、接收页面增量。各会话的脚本在服务器上并发执行，
+共享同一个进程内的资源（任务线程池、片段缓存等），与实际部署时单个 Streamlit 进程
+服务多个用户的情况一致。
+
+每个会话按权重随机执行操作：生成演示文稿、切换主题、准备下载 HTML。生成进行中与浏览器一样，
+按 st.fragment(run_every=...) 下发的间隔只重新运行进度片段，直到出现生成结果。
+统计吞吐量、各操作的 p50/p99 延迟，以及会话全部保持在线时服务器进程中每个会话占用的内存。
+
+需要 websockets>=15（streamlit 的依赖之一）。
+
+    python loadtest_streamlit.py --sessions 8 --actions 10
+    python loadtest_streamlit.py --save-baseline loadtest_streamlit_baseline.json
+    python loadtest_streamlit.py --baseline loadtest_streamlit_baseline.json --max-regression 0.5
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+try:
+    from websockets.sync.client import connect as websocket_connect
+except ImportError:  # 未安装或版本过旧
+    websocket_connect = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "moffee_tool_v1.py")
+TOPICS = ["人工智能发展趋势", "机器学习入门", "云计算架构", "AI 产品规划", "团队季度总结"]
+ACTION_WEIGHTS = {"generate": 4, "switch_theme": 3, "download": 3}
+
+# 生成任务结束时页面上显示的提示及对应的结果；预览区域的提示与生成无关，不作为完成的依据
+GENERATION_OUTCOMES = {
+    Alert.SUCCESS: {"演示文稿生成成功！": "ok"},
+    Alert.INFO: {"已取消生成": "cancelled"},
+    Alert.WARNING: {"当前生成任务较多，请稍后再试": "rejected"},
+}
+GENERATION_FAILED_PREFIX = "生成失败"
+
+
+def percentile(values, q):
+    """最近秩法求分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class AppServer:
+    """用 streamlit run 在子进程中启动应用，等待健康检查通过"""
+
+    def __init__(self, timeout):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", APP_PATH,
+                "--server.headless", "true",
+                "--server.address", "127.0.0.1",
+                "--server.port", str(self.port),
+                "--server.fileWatcherType", "none",
+                "--browser.gatherUsageStats", "false",
+                "--logger.level", "error",
+            ],
+            stdout=subprocess.DEVNULL,
+        )
+        self.url = f"ws://127.0.0.1:{self.port}/_stcore/stream"
+        deadline = time.monotonic() + timeout
+        while not self._healthy():
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError("streamlit 服务器没有启动")
+            time.sleep(0.2)
+
+    def _healthy(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=1)
+        try:
+            connection.request("GET", "/_stcore/health")
+            return connection.getresponse().status == 200
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+    def rss(self):
+        """服务器进程的常驻内存（字节），无法读取 /proc 时返回 None"""
+        try:
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def connect(self, timeout):
+        return websocket_connect(
+            self.url, subprotocols=["streamlit"], open_timeout=timeout, max_size=None, proxy=None
+        )
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class SimulatedSession:
+    """一个模拟用户：持有自己的 WebSocket 连接，按顺序执行操作
+
+    与浏览器前端一样，每次重新运行都带上用户设置过的全部控件状态，按钮点击只在那一次运行中
+    为真；页面按 delta_path 保存最近一次运行输出的元素。
+    """
+
+    def __init__(self, index, connection, timeout):
+        self.index = index
+        self.connection = connection
+        self.timeout = timeout
+        self.elements = {}  # delta_path -> Element
+        self.widgets = {}  # 控件 id -> 用户设置的 WidgetState
+        self.auto_reruns = {}  # fragment id -> 自动重新运行的间隔（秒）
+        self.has_deck = False
+
+    def start(self):
+        self.run()
+
+    def run(self, trigger=None, fragment_id=""):
+        """请求重新运行，等到脚本（包括其中 st.rerun 引起的后续运行）执行完"""
+        message = BackMsg()
+        state = message.rerun_script
+        state.widget_states.widgets.extend(self.widgets.values())
+        if trigger is not None:
+            state.widget_states.widgets.append(WidgetState(id=trigger, trigger_value=True))
+        if fragment_id:
+            state.fragment_id = fragment_id
+            state.is_auto_rerun = True
+        self.connection.send(message.SerializeToString())
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            received = ForwardMsg()
+            received.ParseFromString(self.connection.recv(timeout=max(deadline - time.monotonic(), 0)))
+            kind = received.WhichOneof("type")
+            if kind == "new_session" and not received.new_session.fragment_ids_this_run:
+                # 整页重新运行，上一次的页面和自动重新运行随之失效
+                self.elements.clear()
+                self.auto_reruns.clear()
+            elif kind == "delta" and received.delta.WhichOneof("type") == "new_element":
+                self.elements[tuple(received.metadata.delta_path)] = received.delta.new_element
+            elif kind == "auto_rerun":
+                self.auto_reruns[received.auto_rerun.fragment_id] = received.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                for stopped in received.stop_auto_rerun.fragment_ids:
+                    self.auto_reruns.pop(stopped, None)
+            elif kind == "script_finished" and received.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    def generate(self, rng):
+        text_area = self._element("text_area", "请输入演示文稿主题和内容要求:")
+        self.widgets[text_area.id] = WidgetState(id=text_area.id, string_value=f"{rng.choice(TOPICS)} #{self.index}")
+        self.run()
+        self.run(trigger=self._element("button", "生成演示文稿").id)
+        # 任务在后台线程中执行，按前端收到的间隔重新运行进度片段，直到出现生成结果的提示
+        deadline = time.monotonic() + self.timeout
+        outcome = self._generation_outcome()
+        while outcome is None and self.auto_reruns and time.monotonic() < deadline:
+            fragment_id, interval = next(iter(self.auto_reruns.items()))
+            time.sleep(interval)
+            self.run(fragment_id=fragment_id)
+            outcome = self._generation_outcome()
+        if outcome == "ok":
+            self.has_deck = True
+        return outcome or "timeout"
+
+    def _generation_outcome(self):
+        """生成任务结束时返回结果，仍在进行时返回 None"""
+        for element in self.elements.values():
+            if element.WhichOneof("type") != "alert":
+                continue
+            body = element.alert.body
+            if body in GENERATION_OUTCOMES.get(element.alert.format, {}):
+                return GENERATION_OUTCOMES[element.alert.format][body]
+            if element.alert.format == Alert.ERROR and body.startswith(GENERATION_FAILED_PREFIX):
+                return "failed"
+        return None
+
+    def switch_theme(self, rng):
+        select = self._element("selectbox", "选择主题")
+        current = self.widgets.get(select.id)
+        current = current.string_value if current is not None else select.options[select.default]
+        choice = rng.choice([option for option in select.options if option != current])
+        self.widgets[select.id] = WidgetState(id=select.id, string_value=choice)
+        self.run()
+        return "ok"
+
+    def download(self, rng):
+        if not self.has_deck:
+            return self.generate(rng)
+        button = self._element("button", "准备下载HTML文件", required=False)
+        if button is not None:
+            self.run(trigger=button.id)
+        # 下载内容准备好后页面上出现下载按钮
+        ready = self._element("download_button", "下载HTML文件", required=False) is not None
+        return "ok" if ready else "failed"
+
+    def raised(self):
+        """最近一次运行是否显示了异常"""
+        return any(element.WhichOneof("type") == "exception" for element in self.elements.values())
+
+    def _element(self, kind, label, required=True):
+        for element in self.elements.values():
+            if element.WhichOneof("type") == kind and getattr(element, kind).label == label:
+                return getattr(element, kind)
+        if required:
+            raise LookupError(f"页面上没有{kind}: {label}")
+        return None
+
+
+def run_session(session, args, seed, results, lock):
+    rng = random.Random(seed)
+    actions = list(ACTION_WEIGHTS)
+    weights = [ACTION_WEIGHTS[a] for a in actions]
+    for _ in range(args.actions):
+        action = rng.choices(actions, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = getattr(session, action)(rng)
+            if session.raised():
+                status = "exception"
+        except Exception as e:  # 压测中记录失败而不是中断
+            status = f"error: {type(e).__name__}"
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((action, status, elapsed))
+
+
+def run_load_test(args):
+    server = AppServer(args.timeout)
+    with contextlib.ExitStack() as stack:
+        stack.callback(server.close)
+        # 先用一个会话预热，应用脚本导入的模块和共享资源不计入会话占用的内存
+        with server.connect(args.timeout) as connection:
+            SimulatedSession(-1, connection, args.timeout).start()
+        baseline_rss = server.rss()
+        sessions = [
+            SimulatedSession(i, stack.enter_context(server.connect(args.timeout)), args.timeout)
+            for i in range(args.sessions)
+        ]
+        for session in sessions:
+            session.start()
+        warm_rss = server.rss()
+
+        results, lock = [], threading.Lock()
+        threads = [
+            threading.Thread(target=run_session, args=(session, args, args.seed + i, results, lock))
+            for i, session in enumerate(sessions)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - started
+        # 所有会话仍然保持在线，此时的内存增量即会话占用
+        loaded_rss = server.rss()
+
+    def per_session_kb(rss):
+        if rss is None or baseline_rss is None:
+            return None
+        return round((rss - baseline_rss) / args.sessions / 1024, 1)
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(int)
+    for action, status, elapsed in results:
+        statuses[f"{action}:{status}"] += 1
+        if status == "ok":
+            latencies[action].append(elapsed)
+            latencies["all"].append(elapsed)
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "actions_per_session": args.actions,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "streamlit": __import__("streamlit").__version__,
+            "cpus": os.cpu_count(),
+        },
+        "duration_s": round(duration, 3),
+        "actions": len(results),
+        "throughput_actions_per_s": round(len(results) / duration, 2) if duration else 0.0,
+        "status": dict(sorted(statuses.items())),
+        "latency_ms": {
+            action: {
+                "count": len(values),
+                "p50": round(percentile(values, 50) * 1000, 1),
+                "p99": round(percentile(values, 99) * 1000, 1),
+            }
+            for action, values in sorted(latencies.items())
+        },
+        "memory": {
+            "startup_rss_per_session_kb": per_session_kb(warm_rss),
+            "rss_per_session_kb": per_session_kb(loaded_rss),
+        },
+    }
+
+
+def compare_with_baseline(report, baseline, max_regression):
+    """与基线比较 p99 延迟、吞吐量和每会话内存，返回超出允许范围的指标"""
+    regressions = []
+
+    def check(name, current, previous, higher_is_worse=True):
+        if current is None or not previous or previous != previous:  # 跳过无法测量的、0 和 NaN
+            return
+        change = (current - previous) / previous
+        worse = change if higher_is_worse else -change
+        print(f"  {name:<42} {previous:>10} -> {current:<10} ({change:+.0%})")
+        if worse > max_regression:
+            regressions.append(name)
+
+    print("与基线比较:")
+    differing = [
+        key for key in ("sessions", "actions_per_session", "seed", "cpus")
+        if report["config"].get(key) != baseline["config"].get(key)
+    ]
+    if differing:
+        print("  注意：以下配置与基线不同，结果不可直接比较: " + ", ".join(differing))
+    check("throughput_actions_per_s", report["throughput_actions_per_s"],
+          baseline["throughput_actions_per_s"], higher_is_worse=False)
+    for action, stats in report["latency_ms"].items():
+        if action in baseline["latency_ms"]:
+            check(f"latency_ms.{action}.p99", stats["p99"], baseline["latency_ms"][action]["p99"])
+    check("memory.rss_per_session_kb", report["memory"]["rss_per_session_kb"],
+          baseline["memory"]["rss_per_session_kb"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 界面多会话并发压测")
+    parser.add_argument("--sessions", type=int, default=8, help="同时在线的模拟会话数")
+    parser.add_argument("--actions", type=int, default=10, help="每个会话执行的操作数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="单次脚本运行的超时时间（秒）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--save-baseline", metavar="PATH", help="把结果写入基线文件")
+    parser.add_argument("--baseline", metavar="PATH", help="与基线文件比较")
+    parser.add_argument("--max-regression", type=float, default=0.5,
+                        help="与基线比较时允许的最大退化比例，超出时返回非零退出码")
+    args = parser.parse_args()
+    if websocket_connect is None:
+        parser.error("需要安装 websockets>=15")
+
+    report = run_load_test(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        config = report["config"]
+        print(f"会话: {config['sessions']}  每会话操作: {config['actions_per_session']}  "
+              f"耗时: {report['duration_s']}s  吞吐量: {report['throughput_actions_per_s']} 操作/s")
+        print("状态: " + ", ".join(f"{k}={v}" for k, v in report["status"].items()))
+        for action, stats in report["latency_ms"].items():
+            print(f"  {action:<14} n={stats['count']:<5} p50={stats['p50']}ms  p99={stats['p99']}ms")
+        memory = report["memory"]
+        print(f"每会话内存: RSS {memory['rss_per_session_kb']} KB "
+              f"(空会话 {memory['startup_rss_per_session_kb']} KB)")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"已保存基线 {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("超出允许范围: " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,53 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import tempfile
 import os
 from jinja2 import Environment, FileSystemLoader
-from moffee.compositor import composite, PageOption
+from moffee.compositor import composite, PageOption, parse_frontmatter
 from moffee.markdown import md
-from moffee.utils.md_helper import extract_title
+from moffee.utils.md_helper import extract_title, is_divider, contains_deco, rm_comments
+import abc
 import base64
+import contextlib
+import copy
 import json
+import hashlib
+import html
+import importlib.util
+import io
+import re
+import select
+import shutil
+import struct
+import threading
+import math
+import sys
+import functools
+import multiprocessing
+import unicodedata
+import time
+import uuid
+import zipfile
+import zlib
+import numpy as np
+import yaml
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+try:
+    from pygments import highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import TextLexer, get_lexer_by_name
+    from pygments.util import ClassNotFound
+except ImportError:  # 未安装 Pygments 时代码块不做高亮
+    highlight = None
+
+try:
+    from fontTools import subset as font_subset
+    from fontTools.ttLib import TTCollection, TTFont
+except ImportError:  # 未安装 fontTools 时不能内嵌字体
+    font_subset = None
 
 
 # 定义主题
@@ -74,6 +115,246 @@ THEMES = {
 }
 
 
+# 性能剖析：设置环境变量 PPT_PROFILE=1；
+# 设置 PPT_PROFILE_QUERY_PARAM=1 后也可以在页面地址后加 ?profile=1 剖析单次生成
+class _ProfileState(threading.local):
+    profiler = None  # 类属性作为默认值，未剖析时读取不必经过 AttributeError
+
+
+_profile_state = _ProfileState()
+_NO_PROFILE_STAGE = contextlib.nullcontext()
+# tracemalloc 和采样结果是进程全局的，同一时间只进行一次剖析
+_PROFILE_LOCK = threading.Lock()
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").lower() not in ("", "0", "false", "no")
+
+
+def profiling_requested() -> bool:
+    return _env_flag("PPT_PROFILE")
+
+
+def profile_query_param_allowed() -> bool:
+    """是否允许通过页面地址参数开启剖析"""
+    return _env_flag("PPT_PROFILE_QUERY_PARAM")
+
+
+class RenderProfiler:
+    """单次渲染的性能剖析
+
+    在当前线程中同时进行定时栈采样（输出 flamegraph.pl / speedscope 可读的折叠栈）、
+    cProfile 函数耗时统计和 tracemalloc 内存分配追踪，并按阶段统计耗时和内存增量。
+    结果写入 <prefix>.folded、<prefix>.pstats 和 <prefix>.allocations.txt。
+    tracemalloc 是进程全局的，多个线程的剖析会排队依次进行。
+    """
+
+    def __init__(self, prefix: str, interval: float = 0.002, top: int = 30, alloc_frames: int = 5):
+        self.prefix = prefix
+        self.interval = interval
+        self.top = top
+        self.alloc_frames = alloc_frames
+        self.stages = OrderedDict()  # 阶段名 -> [调用次数, 耗时, CPU 时间, 内存净增]
+        self.files = []
+        self._stack = []
+        self._samples = {}
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._cprofile = None
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        import cProfile
+        import tracemalloc
+
+        if _profile_state.profiler is not None:
+            raise RuntimeError("当前线程已在进行性能剖析")
+        _PROFILE_LOCK.acquire()
+        try:
+            _profile_state.profiler = self
+            self._thread_id = threading.get_ident()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.alloc_frames)
+                self._started_tracemalloc = True
+            tracemalloc.clear_traces()
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError:
+                self._cprofile = None  # 其他剖析工具正在运行
+            self._sampler = threading.Thread(target=self._sample, name="ppt-profiler", daemon=True)
+            self._sampler.start()
+        except BaseException:
+            self._finish()
+            raise
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import tracemalloc
+
+        elapsed = time.perf_counter() - self._started
+        try:
+            if self._cprofile is not None:
+                self._cprofile.disable()
+            self._stop.set()
+            self._sampler.join()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            self._finish()
+        self._write(snapshot, peak, elapsed)
+        return False
+
+    def _finish(self):
+        """停止采样和 tracemalloc，恢复线程状态并释放剖析锁；出错时也必须执行"""
+        import tracemalloc
+
+        try:
+            self._stop.set()
+            if self._sampler is not None and self._sampler.is_alive():
+                self._sampler.join()
+            if self._cprofile is not None:
+                self._cprofile.disable()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        finally:
+            _profile_state.profiler = None
+            _PROFILE_LOCK.release()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        import tracemalloc
+
+        self._stack.append(name)
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        allocated, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            current, _ = tracemalloc.get_traced_memory()
+            record = self.stages.setdefault(name, [0, 0.0, 0.0, 0])
+            record[0] += 1
+            record[1] += time.perf_counter() - started
+            record[2] += time.thread_time() - cpu_started
+            record[3] += current - allocated
+            self._stack.pop()
+
+    def _sample(self):
+        """定时抓取被剖析线程的调用栈"""
+        labels = {}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            stack = (tuple(self._stack), tuple(codes))
+            self._samples[stack] = self._samples.get(stack, 0) + 1
+        # 采样时只记录代码对象，结束后再格式化，减少对被剖析线程的干扰
+        folded = {}
+        for (stages, codes), count in self._samples.items():
+            frames = [f"[{name}]" for name in stages]
+            for code in reversed(codes):
+                if code not in labels:
+                    labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                frames.append(labels[code])
+            key = ";".join(frames)
+            folded[key] = folded.get(key, 0) + count
+        self._samples = folded
+
+    def _write(self, snapshot, peak, elapsed):
+        import tracemalloc
+
+        directory = os.path.dirname(os.path.abspath(self.prefix))
+        os.makedirs(directory, exist_ok=True)
+        folded_path = f"{self.prefix}.folded"
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self._samples.items()):
+                f.write(f"{stack} {count}\n")
+        self.files.append(folded_path)
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(f"{self.prefix}.pstats")
+            self.files.append(f"{self.prefix}.pstats")
+
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        lines = [
+            f"总耗时 {elapsed * 1000:.1f} ms，内存峰值 {peak / 1024:.1f} KB，采样 {sum(self._samples.values())} 次",
+            "",
+            f"{'阶段':<24}{'次数':>6}{'耗时 ms':>12}{'CPU ms':>12}{'内存净增 KB':>14}",
+        ]
+        for name, (calls, wall, cpu, allocated) in self.stages.items():
+            lines.append(f"{name:<24}{calls:>6}{wall * 1000:>12.1f}{cpu * 1000:>12.1f}{allocated / 1024:>14.1f}")
+        lines += ["", f"分配最多的 {self.top} 处（剖析结束时仍存活）:"]
+        for stat in snapshot.statistics("traceback")[:self.top]:
+            lines.append(f"{stat.size / 1024:10.1f} KB {stat.count:8d} 个对象")
+            lines.extend("        " + line for line in stat.traceback.format(limit=4, most_recent_first=True))
+        report_path = f"{self.prefix}.allocations.txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self.files.append(report_path)
+
+
+def profile_stage(name: str):
+    """标记一个剖析阶段；当前线程没有在剖析时几乎没有开销"""
+    profiler = _profile_state.profiler
+    if profiler is None:
+        return _NO_PROFILE_STAGE
+    return profiler.stage(name)
+
+
+def profiled(name: str):
+    """把函数的整个调用记为一个剖析阶段"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _profile_state.profiler
+            if profiler is None:
+                return fn(*args, **kwargs)
+            with profiler.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PageMeta(Mapping):
+    """页面所属的各级标题，实现只读映射接口（meta["h1"]、meta.get("h2")、dict(meta)），与原来的字典兼容"""
+
+    __slots__ = ("h1", "h2", "h3")
+
+    def __init__(self, h1, h2, h3):
+        self.h1 = h1
+        self.h2 = h2
+        self.h3 = h3
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, PageMeta):
+            return (self.h1, self.h2, self.h3) == (other.h1, other.h2, other.h3)
+        if isinstance(other, Mapping):
+            return dict(other) == {"h1": self.h1, "h2": self.h2, "h3": self.h3}
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.h1, self.h2, self.h3))
+
+    def __repr__(self):
+        return f"PageMeta(h1={self.h1!r}, h2={self.h2!r}, h3={self.h3!r})"
+
+
+@profiled("retrieve_structure")
 def retrieve_structure(pages):
     """从页面中提取结构信息"""
     current_h1 = None
@@ -84,24 +365,25 @@ def retrieve_structure(pages):
     last_h3_idx = -1
     page_meta = []
     headings = []
+    meta = None
     for i, page in enumerate(pages):
         if page.h1 and page.h1 != current_h1:
-            current_h1 = page.h1
+            current_h1 = intern_text(page.h1)
             current_h2 = None
             current_h3 = None
             last_h1_idx = len(headings)
-            headings.append({"level": 1, "content": page.h1, "page_ids": []})
+            headings.append({"level": 1, "content": current_h1, "page_ids": []})
 
         if page.h2 and page.h2 != current_h2:
-            current_h2 = page.h2
+            current_h2 = intern_text(page.h2)
             current_h3 = None
             last_h2_idx = len(headings)
-            headings.append({"level": 2, "content": page.h2, "page_ids": []})
+            headings.append({"level": 2, "content": current_h2, "page_ids": []})
 
         if page.h3 and page.h3 != current_h3:
-            current_h3 = page.h3
+            current_h3 = intern_text(page.h3)
             last_h3_idx = len(headings)
-            headings.append({"level": 3, "content": page.h3, "page_ids": []})
+            headings.append({"level": 3, "content": current_h3, "page_ids": []})
 
         if page.h1 or page.h2 or page.h3:
             headings[last_h1_idx]["page_ids"].append(i)
@@ -110,7 +392,10 @@ def retrieve_structure(pages):
         if page.h3:
             headings[last_h3_idx]["page_ids"].append(i)
 
-        page_meta.append({"h1": current_h1, "h2": current_h2, "h3": current_h3})
+        # 标题不变的连续页面共用同一个 PageMeta
+        if meta is None or (meta.h1, meta.h2, meta.h3) != (current_h1, current_h2, current_h3):
+            meta = PageMeta(current_h1, current_h2, current_h3)
+        page_meta.append(meta)
 
     return {"page_meta": page_meta, "headings": headings}
 
@@ -385,6 +670,13 @@ def get_theme_css(theme_name):
         font-family: 'Courier New', Courier, monospace;
     }}
 
+    /* Pre-rendered diagrams */
+    .chunk-paragraph .mermaid-static svg {{
+        width: 100%;
+        height: 100%;
+        color: var(--text-color);
+    }}
+
     /* Presentation mode */
     body.presentation-mode .slide-container {{
         position: fixed;
@@ -464,223 +756,2762 @@ def get_theme_css(theme_name):
     }}
     """
     
+    # 服务端代码高亮的配色
+    css_content += get_code_highlight_css()
+    
     return css_content
 
 
-def render_jinja2(document: str, theme: str = "default") -> str:
-    """使用 Jinja2 模板渲染 HTML"""
-    # 创建临时目录和模板
-    temp_dir = tempfile.mkdtemp()
-    
-    # 根据主题获取CSS
-    css_content = get_theme_css(theme)
-    
-    # 创建 index.html 模板
-    html_template = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{{ title|default('Presentation') }}</title>
-        <style>{{ css_content }}</style>
-    </head>
-    <body>
-        {% for slide in slides %}
-        <div class="slide-container">
-            {% set layout = slide.layout|default('content') %}
-            <div class="slide-content {{ 'centered' if layout == 'centered' else '' }}" 
-                 style="{% for key, value in slide.styles.items() %}{{ key }}: {{ value }}; {% endfor %}">
-                {% if slide.h1 %}
-                <h1>{{ slide.h1 }}</h1>
-                {% endif %}
-                {% if slide.h2 %}
-                <h2>{{ slide.h2 }}</h2>
-                {% endif %}
-                {% if slide.h3 %}
-                <h3>{{ slide.h3 }}</h3>
-                {% endif %}
-                <div class="content">
-                    <div class="auto-sizing">
-                        {% macro render_chunk(chunk) %}
-                            {% if chunk.type == 'paragraph' %}
-                                <div class="chunk chunk-paragraph">
-                                    {{ chunk.paragraph | safe }}
-                                </div>
-                            {% elif chunk.type == 'node' %}
-                                <div class="chunk {% if chunk.direction == 'vertical' %}chunk-vertical{% else %}chunk-horizontal{% endif %}">
-                                    {% for child in chunk.children %}
-                                        {{ render_chunk(child) }}
-                                    {% endfor %}
-                                </div>
-                            {% endif %}
-                        {% endmacro %}
-
-                        {{ render_chunk(slide.chunk) }}
-                    </div>
-                    <div class="slide-number">
-                        <p>{{ loop.index }}</p>
-                    </div>
-                </div>
-            </div>
+# 幻灯片预览每页显示的张数
+PREVIEW_PAGE_SIZE = 10
+
+# 预渲染结果等缓存文件的存放目录
+CACHE_DIR = os.environ.get("PPT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ppt_generator_cache"))
+
+# 幻灯片尺寸及版式，与 get_theme_css 中的样式保持一致
+SLIDE_WIDTH, SLIDE_HEIGHT = 960, 540
+FIT_CONTENT_WIDTH = SLIDE_WIDTH - 2 * 20 - 2 * 15
+FIT_BOTTOM_MARGIN = 30
+FIT_MIN_ELEMENT_PX = 100
+MIN_FIT_SCALE = 0.5
+
+# 后台任务线程数、等待队列上限及界面轮询间隔（秒）
+JOB_WORKERS = int(os.environ.get("PPT_JOB_WORKERS", "2"))
+MAX_PENDING_JOBS = int(os.environ.get("PPT_MAX_PENDING_JOBS", "16"))
+JOB_POLL_INTERVAL = 0.3
+
+# 内容生成后端（stub 或 "模块:工厂函数"）、逐节展开的线程数、每节每次尝试的超时（秒）和重试次数
+CONTENT_BACKEND = os.environ.get("PPT_CONTENT_BACKEND", "stub")
+GENERATION_WORKERS = int(os.environ.get("PPT_GENERATION_WORKERS", "8"))
+SECTION_TIMEOUT = float(os.environ.get("PPT_SECTION_TIMEOUT", "60"))
+SECTION_RETRIES = int(os.environ.get("PPT_SECTION_RETRIES", "2"))
+
+# 文档超过该长度时使用多进程拆分页面，每段不少于 PARALLEL_COMPOSE_MIN_SEGMENT_CHARS
+PARALLEL_COMPOSE_MIN_CHARS = int(os.environ.get("PPT_PARALLEL_COMPOSE_MIN_CHARS", "200000"))
+PARALLEL_COMPOSE_MIN_SEGMENT_CHARS = 20000
+COMPOSE_WORKERS = int(os.environ.get("PPT_COMPOSE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# 多文件构建时各文件平均每段的幻灯片数，修改一张幻灯片只需重新拆分它所在的段
+DECK_SEGMENT_SLIDES = 8
+
+# 代码高亮配色；修改预渲染逻辑时递增版本号，使旧的缓存失效
+CODE_HIGHLIGHT_STYLE = "default"
+BLOCK_RENDERER_VERSION = 2
+
+# 紧凑格式模型的结构版本，修改 deck_model 的编码时递增
+DECK_MODEL_VERSION = 1
+
+# 内嵌字体时查找字体文件的目录，PPT_FONT_DIRS 可追加其他目录（以 os.pathsep 分隔）
+FONT_DIRS = [d for d in os.environ.get("PPT_FONT_DIRS", "").split(os.pathsep) if d] + [
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts"),
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    os.path.expanduser("~/Library/Fonts"),
+    os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts"),
+]
+# 主题字体栈都不含中文时依次尝试的字体
+CJK_FALLBACK_FONTS = [
+    "Noto Sans CJK SC", "Noto Sans SC", "Source Han Sans SC", "Source Han Sans CN",
+    "WenQuanYi Micro Hei", "WenQuanYi Zen Hei", "Microsoft YaHei", "PingFang SC",
+    "Hiragino Sans GB", "SimHei", "Droid Sans Fallback",
+]
+GENERIC_FONT_FAMILIES = {"serif", "sans-serif", "monospace", "cursive", "fantasy", "system-ui"}
+# 安装了 brotli 时输出 WOFF2，否则输出 WOFF（zlib 压缩）
+FONT_COMPRESSION_BROTLI = importlib.util.find_spec("brotli") is not None
+
+# 会话中完整 HTML 的磁盘存储总预算（MB），超出时淘汰最久未使用的
+DECK_STORE_BUDGET_BYTES = int(os.environ.get("PPT_DECK_STORE_BUDGET_MB", "512")) * 1024 * 1024
+
+# 幻灯片全文检索索引
+SEARCH_INDEX_PATH = os.environ.get("PPT_SEARCH_INDEX", os.path.join(CACHE_DIR, "search_index.sqlite3"))
+
+# 单页幻灯片模板；片段缓存时页码先以占位符代替
+SLIDE_NUMBER_PLACEHOLDER = "<!--slide-number-->"
+SLIDE_TEMPLATE = """
+{% macro render_chunk(chunk) %}
+    {% if chunk.type == 'paragraph' %}
+        <div class="chunk chunk-paragraph">
+            {{ chunk.paragraph | safe }}
         </div>
-        {% endfor %}
-        <div class="floating-btn">
-            <button class="action-btn" onclick="togglePresentationMode()">
-                &#128187; Toggle Slideshow
-            </button>
-            <button class="action-btn" onclick="window.print()">
-                &#128424; Save as PDF
-            </button>
+    {% elif chunk.type == 'node' %}
+        <div class="chunk {% if chunk.direction == 'vertical' %}chunk-vertical{% else %}chunk-horizontal{% endif %}">
+            {% for child in chunk.children %}
+                {{ render_chunk(child) }}
+            {% endfor %}
         </div>
-        <script>
-        // Presentation mode
-        let isPresentationMode = false;
-        let currentSlide = 0;
-        const slides = document.querySelectorAll('.slide-container');
-
-        function togglePresentationMode() {
-            isPresentationMode = !isPresentationMode;
-            if (isPresentationMode) {
-                enterPresentationMode();
-            } else {
-                exitPresentationMode();
-            }
-        }
+    {% endif %}
+{% endmacro %}
+<div class="slide-container">
+    {% set layout = slide.layout|default('content') %}
+    <div class="slide-content {{ 'centered' if layout == 'centered' else '' }}" 
+         style="{% for key, value in slide.styles.items() %}{{ key }}: {{ value }}; {% endfor %}">
+        {% if slide.h1 %}
+        <h1>{{ slide.h1 }}</h1>
+        {% endif %}
+        {% if slide.h2 %}
+        <h2>{{ slide.h2 }}</h2>
+        {% endif %}
+        {% if slide.h3 %}
+        <h3>{{ slide.h3 }}</h3>
+        {% endif %}
+        <div class="content">
+            <div class="auto-sizing"{% if slide.fit_scale < 1 %} style="transform: scale({{ slide.fit_scale }}); width: {{ '%.2f'|format(100 / slide.fit_scale) }}%;"{% endif %}>
+                {{ render_chunk(slide.chunk) }}
+            </div>
+            <div class="slide-number">
+                <p>{{ number }}</p>
+            </div>
+        </div>
+    </div>
+</div>
+"""
 
-        function enterPresentationMode() {
-            document.body.classList.add('presentation-mode');
-            showSlide(currentSlide);
-            document.addEventListener('keydown', handleKeydown);
+# 演示文稿页面的放映和 Markdown 渲染脚本
+DECK_SCRIPT = """
+    // Presentation mode
+    let isPresentationMode = false;
+    let currentSlide = 0;
+    const slides = document.querySelectorAll('.slide-container');
+
+    function togglePresentationMode() {
+        isPresentationMode = !isPresentationMode;
+        if (isPresentationMode) {
+            enterPresentationMode();
+        } else {
+            exitPresentationMode();
         }
+    }
+
+    function enterPresentationMode() {
+        document.body.classList.add('presentation-mode');
+        showSlide(currentSlide);
+        document.addEventListener('keydown', handleKeydown);
+    }
+
+    function exitPresentationMode() {
+        document.body.classList.remove('presentation-mode');
+        slides.forEach(slide => slide.classList.remove('active'));
+        document.removeEventListener('keydown', handleKeydown);
+    }
 
-        function exitPresentationMode() {
-            document.body.classList.remove('presentation-mode');
-            slides.forEach(slide => slide.classList.remove('active'));
-            document.removeEventListener('keydown', handleKeydown);
+    function handleKeydown(event) {
+        switch (event.key) {
+            case 'ArrowRight':
+            case 'ArrowDown':
+            case ' ':
+                showSlide(currentSlide + 1);
+                break;
+            case 'ArrowLeft':
+            case 'ArrowUp':
+                showSlide(currentSlide - 1);
+                break;
+            case 'Escape':
+                togglePresentationMode();
+                break;
         }
+    }
 
-        function handleKeydown(event) {
-            switch (event.key) {
-                case 'ArrowRight':
-                case 'ArrowDown':
-                case ' ':
-                    showSlide(currentSlide + 1);
-                    break;
-                case 'ArrowLeft':
-                case 'ArrowUp':
-                    showSlide(currentSlide - 1);
-                    break;
-                case 'Escape':
-                    togglePresentationMode();
-                    break;
-            }
+    function printDeck() {
+        window.print();
+    }
+
+    function showSlide(index) {
+        if (index < 0) {
+            return;
+        }
+        if (currentSlide < slides.length) {
+            slides[currentSlide].classList.remove('active');
         }
+        if (index >= slides.length) {
+            currentSlide = slides.length - 1;
+        } else {
+            currentSlide = index
+            slides[currentSlide].classList.add('active');
+        }
+    }
+
+    // 添加 Markdown 渲染函数
+    function renderMarkdown(text) {
+        // 简单的 Markdown 渲染实现
+        // 服务端预渲染的代码块和图表不参与转换
+        const preserved = [];
+        let html = text.replace(/<pre[\\s\\S]*?<\\/pre>|<svg[\\s\\S]*?<\\/svg>/g, function(block) {
+            preserved.push(block);
+            return '\\u0000' + (preserved.length - 1) + '\\u0000';
+        });
+        
+        // 转换标题
+        html = html.replace(/^### (.*$)/gm, '<h3>$1</h3>');
+        html = html.replace(/^## (.*$)/gm, '<h2>$1</h2>');
+        html = html.replace(/^# (.*$)/gm, '<h1>$1</h1>');
+        
+        // 转换图片
+        html = html.replace(/!\\[([^\\]]*)\\]\\(([^)\\s]+)(?:\\s+"[^"]*")?\\)/g, '<img src="$2" alt="$1">');
+        
+        // 转换粗体和斜体
+        html = html.replace(/\\*\\*(.*?)\\*\\*/g, '<strong>$1</strong>');
+        html = html.replace(/\\*(.*?)\\*/g, '<em>$1</em>');
+        
+        // 转换列表
+        html = html.replace(/^\\- (.*$)/gm, '<li>$1</li>');
+        html = html.replace(/(<li>.*<\\/li>)/s, '<ul>$1</ul>');
+        
+        // 转换段落
+        html = html.replace(/^\\s*$(.*?)^\\s*$/gm, '<p>$1</p>');
+        
+        // 处理换行
+        html = html.replace(/\\n/g, '<br>');
+        
+        // 还原预渲染的内容
+        html = html.replace(/\\u0000(\\d+)\\u0000/g, function(_, i) {
+            return preserved[Number(i)];
+        });
+        
+        return html;
+    }
 
-        function showSlide(index) {
-            if (index < 0) {
+    // 初始化时渲染 Markdown 内容
+    document.addEventListener('DOMContentLoaded', function() {
+        const paragraphs = document.querySelectorAll('.chunk-paragraph');
+        paragraphs.forEach(function(p) {
+            if (p.innerHTML.trim().startsWith('<p>')) {
+                // 已经是 HTML，不需要转换
                 return;
             }
-            if (currentSlide < slides.length) {
-                slides[currentSlide].classList.remove('active');
+            // 简单处理 Markdown 内容
+            p.innerHTML = renderMarkdown(p.innerHTML);
+        });
+    });
+"""
+
+# 演示文稿页面模板，幻灯片部分由预先渲染好的片段拼接
+DECK_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title|default('Presentation') }}</title>
+    <style>{{ css_content }}</style>
+    {% if font_css %}<style>{{ font_css }}</style>{% endif %}
+</head>
+<body>
+    {% for fragment in fragments %}
+    {{ fragment }}
+    {% endfor %}
+    <div class="floating-btn">
+        <button class="action-btn" onclick="togglePresentationMode()">
+            &#128187; Toggle Slideshow
+        </button>
+        <button class="action-btn" onclick="printDeck()">
+            &#128424; Save as PDF
+        </button>
+    </div>
+    <script>
+    {{ deck_script }}
+    </script>
+</body>
+</html>
+"""
+
+# 拆分导出的入口页面：每张幻灯片先放一个同尺寸的占位容器，内容按需加载
+SPLIT_DECK_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title|default('Presentation') }}</title>
+    <link rel="stylesheet" href="{{ stylesheet }}">
+</head>
+<body>
+    {% for src in slide_files %}
+    <div class="slide-container" data-src="{{ src }}"></div>
+    {% endfor %}
+    <div class="floating-btn">
+        <button class="action-btn" onclick="togglePresentationMode()">
+            &#128187; Toggle Slideshow
+        </button>
+        <button class="action-btn" onclick="printDeck()">
+            &#128424; Save as PDF
+        </button>
+    </div>
+    <script src="{{ script }}"></script>
+</body>
+</html>
+"""
+
+# 拆分导出的加载脚本，追加在 DECK_SCRIPT 之后
+SPLIT_DECK_SCRIPT = """
+    // 按需加载幻灯片片段：滚动到附近时加载，放映时预取前后几张
+    const slideRequests = new Map();
+
+    function loadSlide(index) {
+        if (index < 0 || index >= slides.length) {
+            return Promise.resolve();
+        }
+        if (!slideRequests.has(index)) {
+            const container = slides[index];
+            const request = fetch(container.dataset.src)
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.status + ' ' + container.dataset.src);
+                    }
+                    return response.text();
+                })
+                .then(function(text) {
+                    const template = document.createElement('template');
+                    template.innerHTML = text.replace({{ placeholder }}, String(index + 1));
+                    const slide = template.content.querySelector('.slide-container');
+                    container.replaceChildren(...slide.childNodes);
+                    container.querySelectorAll('.chunk-paragraph').forEach(function(p) {
+                        if (!p.innerHTML.trim().startsWith('<p>')) {
+                            p.innerHTML = renderMarkdown(p.innerHTML);
+                        }
+                    });
+                    slideObserver.unobserve(container);
+                })
+                .catch(function(error) {
+                    // 加载失败时允许再次尝试
+                    slideRequests.delete(index);
+                    console.error(error);
+                });
+            slideRequests.set(index, request);
+        }
+        return slideRequests.get(index);
+    }
+
+    const slideObserver = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (entry.isIntersecting) {
+                loadSlide(Number(entry.target.dataset.index));
             }
-            if (index >= slides.length) {
-                currentSlide = slides.length - 1;
-            } else {
-                currentSlide = index
-                slides[currentSlide].classList.add('active');
+        });
+    }, {rootMargin: '1200px 0px'});
+
+    slides.forEach(function(slide, index) {
+        slide.dataset.index = index;
+        slideObserver.observe(slide);
+    });
+
+    const showLoadedSlide = showSlide;
+    showSlide = function(index) {
+        showLoadedSlide(index);
+        for (let i = index - 1; i <= index + 2; i++) {
+            loadSlide(i);
+        }
+    };
+
+    printDeck = function() {
+        const requests = Array.prototype.map.call(slides, function(_, index) {
+            return loadSlide(index);
+        });
+        Promise.all(requests).then(function() {
+            window.print();
+        });
+    };
+"""
+
+# 紧凑格式的演示文稿页面：幻灯片以 JSON 模型内嵌，由脚本在浏览器中按需渲染
+DECK_MODEL_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title|default('Presentation') }}</title>
+    <style>{{ css_content }}</style>
+    {% if font_css %}<style>{{ font_css }}</style>{% endif %}
+</head>
+<body>
+    <div class="floating-btn">
+        <button class="action-btn" onclick="togglePresentationMode()">
+            &#128187; Toggle Slideshow
+        </button>
+        <button class="action-btn" onclick="printDeck()">
+            &#128424; Save as PDF
+        </button>
+    </div>
+    <script type="application/json" id="deck-model">{{ model_json }}</script>
+    <script>
+    {{ model_runtime }}
+    {{ deck_script }}
+    {{ model_script }}
+    </script>
+</body>
+</html>
+"""
+
+# 紧凑模型的解码和单页渲染，生成与 SLIDE_TEMPLATE 相同的元素结构
+DECK_MODEL_RUNTIME = """
+    // 段落内容前后的空白与 SLIDE_TEMPLATE 一致，renderMarkdown 的结果才相同
+    const PARAGRAPH_PREFIX = '\\n            ';
+    const PARAGRAPH_SUFFIX = '\\n        ';
+
+    function renderChunkHtml(model, chunk) {
+        if (typeof chunk === 'number') {
+            return '<div class="chunk chunk-paragraph">' + PARAGRAPH_PREFIX + model.strings[chunk]
+                + PARAGRAPH_SUFFIX + '</div>';
+        }
+        if (Array.isArray(chunk)) {
+            let html = '<div class="chunk ' + (chunk[0] ? 'chunk-vertical' : 'chunk-horizontal') + '">';
+            for (let i = 1; i < chunk.length; i++) {
+                html += renderChunkHtml(model, chunk[i]);
             }
+            return html + '</div>';
         }
+        return '';
+    }
 
-        // 添加 Markdown 渲染函数
-        function renderMarkdown(text) {
-            // 简单的 Markdown 渲染实现
-            let html = text;
-            
-            // 转换标题
-            html = html.replace(/^### (.*$)/gm, '<h3>$1</h3>');
-            html = html.replace(/^## (.*$)/gm, '<h2>$1</h2>');
-            html = html.replace(/^# (.*$)/gm, '<h1>$1</h1>');
-            
-            // 转换粗体和斜体
-            html = html.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
-            html = html.replace(/\*(.*?)\*/g, '<em>$1</em>');
-            
-            // 转换列表
-            html = html.replace(/^\- (.*$)/gm, '<li>$1</li>');
-            html = html.replace(/(<li>.*<\/li>)/s, '<ul>$1</ul>');
-            
-            // 转换段落
-            html = html.replace(/^\s*$(.*?)^\s*$/gm, '<p>$1</p>');
-            
-            // 处理换行
-            html = html.replace(/\n/g, '<br>');
-            
-            return html;
+    // 返回 .slide-container 的内部 HTML；省略的末尾字段取默认值
+    function renderSlideHtml(model, index) {
+        const slide = model.slides[index];
+        const strings = model.strings;
+        const scale = slide.length > 6 ? slide[6] : 1;
+        let html = '<div class="slide-content ' + (slide[5] ? 'centered' : '') + '" style="'
+            + strings[slide[4] || 0] + '">';
+        ['h1', 'h2', 'h3'].forEach(function(tag, level) {
+            if (slide[level]) {
+                html += '<' + tag + '>' + strings[slide[level]] + '</' + tag + '>';
+            }
+        });
+        html += '<div class="content"><div class="auto-sizing"';
+        if (scale < 1) {
+            html += ' style="transform: scale(' + scale + '); width: ' + (100 / scale).toFixed(2) + '%;"';
         }
+        html += '>' + renderChunkHtml(model, slide[3]) + '</div>'
+            + '<div class="slide-number"><p>' + (index + 1) + '</p></div></div></div>';
+        return html;
+    }
+"""
 
-        // 初始化时渲染 Markdown 内容
-        document.addEventListener('DOMContentLoaded', function() {
-            const paragraphs = document.querySelectorAll('.chunk-paragraph');
-            paragraphs.forEach(function(p) {
-                if (p.innerHTML.trim().startsWith('<p>')) {
-                    // 已经是 HTML，不需要转换
-                    return;
-                }
-                // 简单处理 Markdown 内容
+# 紧凑格式的页面脚本：DECK_SCRIPT 之前创建空的幻灯片容器，之后按需填入内容
+DECK_MODEL_SCRIPT = """
+    // 滚动到附近或放映时才渲染幻灯片，打印前渲染全部
+    const renderedSlides = new Set();
+    const slideIndex = new Map();
+
+    function loadSlide(index) {
+        if (index < 0 || index >= slides.length || renderedSlides.has(index)) {
+            return;
+        }
+        renderedSlides.add(index);
+        const container = slides[index];
+        container.innerHTML = renderSlideHtml(deckModel, index);
+        container.querySelectorAll('.chunk-paragraph').forEach(function(p) {
+            if (!p.innerHTML.trim().startsWith('<p>')) {
                 p.innerHTML = renderMarkdown(p.innerHTML);
-            });
+            }
+        });
+        slideObserver.unobserve(container);
+    }
+
+    function loadAllSlides() {
+        for (let i = 0; i < slides.length; i++) {
+            loadSlide(i);
+        }
+    }
+
+    const slideObserver = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (entry.isIntersecting) {
+                loadSlide(slideIndex.get(entry.target));
+            }
+        });
+    }, {rootMargin: '1200px 0px'});
+
+    // 在 DECK_SCRIPT 的初始化之后开始渲染，段落不会被转换两次
+    document.addEventListener('DOMContentLoaded', function() {
+        slides.forEach(function(slide, index) {
+            slideIndex.set(slide, index);
+            slideObserver.observe(slide);
+        });
+    });
+
+    const showLoadedSlide = showSlide;
+    showSlide = function(index) {
+        for (let i = index - 1; i <= index + 2; i++) {
+            loadSlide(i);
+        }
+        showLoadedSlide(index);
+    };
+
+    printDeck = function() {
+        loadAllSlides();
+        window.print();
+    };
+    window.addEventListener('beforeprint', loadAllSlides);
+"""
+
+# 紧凑模型开头：解析 JSON 并创建幻灯片容器，放在按钮之前，与完整 HTML 的元素顺序相同
+DECK_MODEL_BOOTSTRAP = """
+    const deckModel = JSON.parse(document.getElementById('deck-model').textContent);
+    (function() {
+        const containers = document.createDocumentFragment();
+        deckModel.slides.forEach(function() {
+            const container = document.createElement('div');
+            container.className = 'slide-container';
+            containers.appendChild(container);
         });
-        </script>
-    </body>
-    </html>
+        document.body.insertBefore(containers, document.querySelector('.floating-btn'));
+    })();
+"""
+
+# 打包导出中的演示文稿页面：样式表和脚本引用包内共用的资源文件
+BUNDLE_DECK_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title|default('Presentation') }}</title>
+    {% for href in stylesheets %}
+    <link rel="stylesheet" href="{{ href }}">
+    {% endfor %}
+</head>
+<body>
+    {% for fragment in fragments %}
+    {{ fragment }}
+    {% endfor %}
+    <div class="floating-btn">
+        <button class="action-btn" onclick="togglePresentationMode()">
+            &#128187; Toggle Slideshow
+        </button>
+        <button class="action-btn" onclick="printDeck()">
+            &#128424; Save as PDF
+        </button>
+    </div>
+    {% if model_json %}
+    <script type="application/json" id="deck-model">{{ model_json }}</script>
+    {% endif %}
+    <script src="{{ script }}"></script>
+</body>
+</html>
+"""
+
+# 打包导出的目录页
+BUNDLE_INDEX_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="zh">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>演示文稿（{{ decks|length }} 个）</title>
+    <style>
+        body { font-family: sans-serif; max-width: 800px; margin: 40px auto; padding: 0 20px; }
+        li { margin: 8px 0; }
+        .count { color: #888; margin-left: 8px; }
+    </style>
+</head>
+<body>
+    <h1>演示文稿（{{ decks|length }} 个）</h1>
+    <ul>
+        {% for deck in decks %}
+        <li><a href="{{ deck.href }}">{{ deck.title|e }}</a><span class="count">{{ deck.slides }} 张</span></li>
+        {% endfor %}
+    </ul>
+</body>
+</html>
+"""
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def content_hash(*parts) -> str:
+    """计算内容哈希，用作缓存键"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def renderer_version() -> str:
+    """渲染器版本摘要：本模块源码（包括全部模板）和渲染相关依赖的版本，升级或修改后随之改变"""
+    from importlib import metadata
+
+    versions = []
+    for package in ("moffee", "Jinja2", "Pygments", "fonttools"):
+        try:
+            versions.append((package, metadata.version(package)))
+        except metadata.PackageNotFoundError:
+            versions.append((package, None))
+    with open(os.path.abspath(__file__), "rb") as f:
+        source_digest = hashlib.sha256(f.read()).hexdigest()
+    return content_hash("renderer", source_digest, versions)[:16]
+
+
+@st.cache_resource
+def _shared_resource_registry():
+    """所有共享资源的存放处；streamlit 每次重新运行脚本都会重新执行本模块，资源需要存在 st.cache_resource 中才能保留"""
+    return {}, threading.RLock()
+
+
+# 只在模块执行时从 st.cache_resource 取一次，之后后台线程读取资源时不再经过 streamlit；
+# 命令行、进程池和测试中没有脚本运行上下文，直接使用进程内的字典
+_SHARED_RESOURCES, _SHARED_RESOURCES_LOCK = (
+    _shared_resource_registry() if get_script_run_ctx(suppress_warning=True) is not None
+    else ({}, threading.RLock())
+)
+
+
+def shared_resource(factory):
+    """进程内共享的资源：按参数只创建一次，clear() 后重新创建
+
+    与 st.cache_resource 作用相同，但在后台线程、进程池和命令行中调用
+    不会输出 missing ScriptRunContext 警告。
     """
-    
-    # 将 CSS 和 HTML 模板写入临时文件
-    with open(os.path.join(temp_dir, "styles.css"), "w") as f:
-        f.write(css_content)
-    
-    # 创建模板环境
+    name = f"{factory.__module__}.{factory.__qualname__}"
+
+    @functools.wraps(factory)
+    def getter(*args):
+        key = (name, args)
+        try:
+            return _SHARED_RESOURCES[key]
+        except KeyError:
+            pass
+        with _SHARED_RESOURCES_LOCK:
+            if key not in _SHARED_RESOURCES:
+                _SHARED_RESOURCES[key] = factory(*args)
+            return _SHARED_RESOURCES[key]
+
+    def clear():
+        with _SHARED_RESOURCES_LOCK:
+            for key in [key for key in _SHARED_RESOURCES if key[0] == name]:
+                del _SHARED_RESOURCES[key]
+
+    getter.clear = clear
+    return getter
+
+
+@shared_resource
+def get_jinja_env():
+    """创建模板环境并预编译模板"""
     env = Environment()
     env.filters["safe"] = lambda x: x  # 添加 safe 过滤器
-    
-    template = env.from_string(html_template)
-    
-    # 填充模板
-    pages = composite(document)
-    title = extract_title(document) or "Untitled"
-    slide_struct = retrieve_structure(pages)
-    _, options = PageOption(), None  # 简化处理
-    width, height = 960, 540  # 固定尺寸
+    return env
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(source: str):
+    """编译模板源码，同一模板只编译一次"""
+    return get_jinja_env().from_string(source)
+
+
+@shared_resource
+def get_compose_cache():
+    """文档 -> 页面列表 的缓存"""
+    return LRUCache(max_entries=32)
+
+
+@shared_resource
+def get_fragment_cache():
+    """单页幻灯片 HTML 片段缓存"""
+    return LRUCache(max_entries=8192)
+
+
+@shared_resource
+def get_prefetch_executor():
+    """预取相邻预览页所用的线程池"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="ppt-prefetch")
+
+
+class DiskCache:
+    """按内容哈希存放在磁盘上的缓存，前面加一层内存 LRU"""
+
+    def __init__(self, namespace, max_memory_entries=1024):
+        self.directory = os.path.join(CACHE_DIR, namespace)
+        self._memory = LRUCache(max_entries=max_memory_entries)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+        try:
+            with open(self._path(key), "rb") as f:
+                value = f.read()
+        except OSError:
+            return None
+        self._memory.put(key, value)
+        return value
+
+    def put(self, key, value: bytes):
+        self._memory.put(key, value)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读到写了一半的内容
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # 磁盘缓存写入失败时只保留内存缓存
+
+
+@shared_resource
+def get_block_cache():
+    """代码块和图表的预渲染结果缓存"""
+    return DiskCache("blocks")
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_highlight_css() -> str:
+    """Pygments 代码高亮所需的 CSS，未安装 Pygments 时为空"""
+    if highlight is None:
+        return ""
+    return HtmlFormatter(style=CODE_HIGHLIGHT_STYLE).get_style_defs(".highlight")
+
+
+def highlight_code(source: str, language: str) -> str:
+    """在服务端为代码块生成高亮后的 HTML"""
+    language_class = f' class="language-{html.escape(language)}"' if language else ""
+    if highlight is None:
+        return f'<pre class="highlight"><code{language_class}>{html.escape(source)}</code></pre>'
+    try:
+        lexer = get_lexer_by_name(language) if language else TextLexer()
+    except ClassNotFound:
+        lexer = TextLexer()
+    code_html = highlight(source, lexer, HtmlFormatter(nowrap=True)).rstrip("\n")
+    return f'<pre class="highlight"><code{language_class}>{code_html}</code></pre>'
+
+
+def _font_family_names(stack: str):
+    """拆分 CSS 字体栈，去掉引号"""
+    return [family.strip().strip("'\"") for family in stack.split(",") if family.strip()]
+
+
+@shared_resource
+def get_font_catalog():
+    """扫描本机字体目录，返回 {小写字体族名: (文件路径, 集合内序号)}，同一字族优先常规字重"""
+    catalog = {}
+    if font_subset is None:
+        return catalog
+    ranks = {}
+    for directory in FONT_DIRS:
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if not name.lower().endswith((".ttf", ".otf", ".ttc", ".otc")):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    is_collection = name.lower().endswith((".ttc", ".otc"))
+                    count = len(TTCollection(path, lazy=True).fonts) if is_collection else 1
+                    for index in range(count):
+                        font = TTFont(path, fontNumber=index if is_collection else -1, lazy=True)
+                        names = font["name"]
+                        style = (names.getDebugName(17) or names.getDebugName(2) or "").lower()
+                        rank = 0 if style in ("regular", "normal", "book", "roman") else 1
+                        # 包括本地化的字族名，主题中写“微软雅黑”或“Microsoft YaHei”都能找到
+                        families = {
+                            record.toUnicode().strip().lower()
+                            for record in names.names if record.nameID in (1, 16)
+                        }
+                        font.close()
+                        for family in families:
+                            if rank < ranks.get(family, 2):
+                                catalog[family] = (path, index if is_collection else -1)
+                                ranks[family] = rank
+                except Exception:  # 损坏或不支持的字体文件直接跳过
+                    continue
+    return catalog
 
+
+@functools.lru_cache(maxsize=64)
+def _font_codepoints(path: str, index: int, mtime_ns: int) -> frozenset:
+    """字体 cmap 中包含的全部码点"""
+    font = TTFont(path, fontNumber=index, lazy=True)
+    try:
+        return frozenset(font.getBestCmap() or ())
+    finally:
+        font.close()
+
+
+@shared_resource
+def get_font_cache():
+    """子集字体缓存，按（字体文件，字符集哈希）存放"""
+    return DiskCache("fonts", max_memory_entries=32)
+
+
+def subset_font(path: str, index: int, codepoints):
+    """把字体裁剪为只包含指定字符的子集并压缩
+
+    返回 (字体数据, 格式, 实际覆盖的码点)；字体不含其中任何字符时返回 None。
+    """
+    stat = os.stat(path)
+    covered = sorted(set(codepoints) & _font_codepoints(path, index, stat.st_mtime_ns))
+    if not covered:
+        return None
+    flavor = "woff2" if FONT_COMPRESSION_BROTLI else "woff"
+    cache = get_font_cache()
+    key = content_hash("font", path, index, stat.st_mtime_ns, stat.st_size, flavor, content_hash(covered))
+    data = cache.get(key)
+    if data is None:
+        options = font_subset.Options()
+        options.flavor = flavor
+        options.desubroutinize = True
+        options.font_number = index
+        font = font_subset.load_font(path, options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=covered)
+        subsetter.subset(font)
+        buffer = io.BytesIO()
+        font_subset.save_font(font, buffer, options)
+        font.close()
+        data = buffer.getvalue()
+        cache.put(key, data)
+    return data, flavor, set(covered)
+
+
+def collect_deck_codepoints(fragments):
+    """收集幻灯片中显示的全部字符（去掉标签、脚本和样式）"""
+    text = re.sub(r"<(script|style)\b.*?</\1>", "", "".join(fragments), flags=re.S | re.I)
+    text = html.unescape(re.sub(r"<[^>]+>", "", text))
+    return {ord(char) for char in text if not char.isspace()}
+
+
+def embedded_font_css(theme: str, fragments, font_url=None):
+    """为主题字体生成内嵌子集字体的 @font-face 规则
+
+    按字体栈顺序裁剪本机能找到的字体；栈中字体都不能覆盖的字符，
+    再从常见中文字体中找一个补上，并把它加入字体栈。
+    font_url(字体数据, 格式) 返回引用字体的地址，默认内嵌为 data URI。
+    返回 (CSS, 报告)，报告包含各内嵌字体的大小和未能覆盖的字符。
+    """
+    report = {"fonts": {}, "missing": ""}
+    if font_subset is None:
+        return "", report
+    text_codepoints = collect_deck_codepoints(fragments)
+    # 页码由浏览器端填入，ASCII 可见字符总是包含
+    codepoints = text_codepoints | set(range(33, 127))
+    catalog = get_font_catalog()
+    wanted = {}  # 字族名 -> 需要从该字体中取的码点
+    overrides, missing = [], set()
+
+    def coverage(family):
+        location = catalog.get(family.lower())
+        if location is None:
+            return set()
+        path, index = location
+        return _font_codepoints(path, index, os.stat(path).st_mtime_ns)
+
+    # 先按两个字体栈分别确定每个字体要覆盖的字符，同一字体取并集后只裁剪一次
+    fonts = THEMES.get(theme, THEMES["default"])["fonts"]
+    for variable, stack in (("--heading-font", fonts["heading"]), ("--body-font", fonts["body"])):
+        families = _font_family_names(stack)
+        remaining = set(codepoints)
+        for family in families:
+            if family.lower() not in GENERIC_FONT_FAMILIES:
+                covered = codepoints & coverage(family)
+                if covered:
+                    wanted.setdefault(family, set()).update(covered)
+                    remaining -= covered
+        if remaining - set(range(33, 127)):
+            for family in CJK_FALLBACK_FONTS:
+                covered = remaining & coverage(family)
+                if covered:
+                    wanted.setdefault(family, set()).update(covered)
+                    remaining -= covered
+                    # 补充字体放在通用字体族之前
+                    position = next(
+                        (i for i, name in enumerate(families) if name.lower() in GENERIC_FONT_FAMILIES),
+                        len(families),
+                    )
+                    families.insert(position, family)
+                    overrides.append(f"{variable}: " + ", ".join(
+                        name if name.lower() in GENERIC_FONT_FAMILIES else f'"{name}"' for name in families
+                    ) + ";")
+                    break
+        missing |= remaining & text_codepoints
+
+    rules = []
+    for family, family_codepoints in wanted.items():
+        result = subset_font(*catalog[family.lower()], family_codepoints)
+        if result is None:
+            continue
+        data, flavor, _ = result
+        report["fonts"][family] = len(data)
+        if font_url is None:
+            url = f'data:font/{flavor};base64,{base64.b64encode(data).decode("ascii")}'
+        else:
+            url = font_url(data, flavor)
+        rules.append(
+            f'@font-face {{ font-family: "{family}"; font-display: swap; '
+            f'src: url({url}) format("{flavor}"); }}'
+        )
+    if overrides:
+        rules.append(":root { " + " ".join(overrides) + " }")
+    report["missing"] = "".join(sorted(map(chr, missing)))
+    return "\n".join(rules), report
+
+
+# Mermaid 流程图语法的子集：节点、连线和连线标签
+_MERMAID_FLOW_HEADER = re.compile(r"^(?:graph|flowchart)\s+(TD|TB|BT|LR|RL)\s*;?$")
+_MERMAID_NODE = re.compile(
+    r"\s*(\w+)\s*(\(\((.*?)\)\)|\[(.*?)\]|\((.*?)\)|\{(.*?)\})?"
+)
+_MERMAID_EDGE = re.compile(r"\s*(-->|---|==>|-\.->)\s*(?:\|(.*?)\|)?")
+_MERMAID_PIE_SLICE = re.compile(r'^"(.+?)"\s*:\s*([0-9]+(?:\.[0-9]+)?)$')
+_MERMAID_PALETTE = ["#4e79a7", "#f28e2b", "#e15759", "#76b7b2", "#59a14f",
+                    "#edc948", "#b07aa1", "#ff9da7", "#9c755f", "#bab0ac"]
+
+
+def _svg_text_width(text: str, font_size: float) -> float:
+    """粗略估计 SVG 文本宽度，中日韩字符按全角计算"""
+    return sum(
+        font_size if unicodedata.east_asian_width(c) in "WF" else font_size * 0.6
+        for c in text
+    )
+
+
+def _render_mermaid_pie(lines):
+    """将 Mermaid 饼图渲染为 SVG"""
+    header = lines[0].split(None, 1)
+    title = header[1].strip() if len(header) > 1 and header[1].startswith("title ") else ""
+    title = title[len("title "):].strip() if title else ""
+    slices = []
+    for line in lines[1:]:
+        if line.startswith("title "):
+            title = line[len("title "):].strip()
+            continue
+        match = _MERMAID_PIE_SLICE.match(line)
+        if not match:
+            return None
+        slices.append((match.group(1), float(match.group(2))))
+    total = sum(value for _, value in slices)
+    if not slices or total <= 0:
+        return None
+
+    top = 40 if title else 10
+    cx, cy, r = 150, top + 130, 120
+    legend_width = max(_svg_text_width(f"{label} 100.0%", 14) for label, _ in slices)
+    width = int(cx + r + 40 + legend_width + 30)
+    height = int(max(cy + r + 10, top + 24 * len(slices) + 20))
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'preserveAspectRatio="xMidYMid meet">'
+    ]
+    if title:
+        parts.append(f'<text x="{width / 2:.1f}" y="26" text-anchor="middle" font-size="18" '
+                     f'fill="currentColor">{html.escape(title)}</text>')
+    angle = -math.pi / 2
+    for i, (label, value) in enumerate(slices):
+        color = _MERMAID_PALETTE[i % len(_MERMAID_PALETTE)]
+        share = value / total
+        if share >= 1:
+            parts.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>')
+        else:
+            end = angle + share * 2 * math.pi
+            x1, y1 = cx + r * math.cos(angle), cy + r * math.sin(angle)
+            x2, y2 = cx + r * math.cos(end), cy + r * math.sin(end)
+            large_arc = 1 if share > 0.5 else 0
+            parts.append(
+                f'<path d="M{cx},{cy} L{x1:.2f},{y1:.2f} A{r},{r} 0 {large_arc} 1 {x2:.2f},{y2:.2f} Z" '
+                f'fill="{color}" stroke="#fff" stroke-width="1"/>'
+            )
+            angle = end
+        ly = top + 24 * i + 10
+        parts.append(f'<rect x="{cx + r + 40}" y="{ly}" width="14" height="14" fill="{color}"/>')
+        parts.append(f'<text x="{cx + r + 60}" y="{ly + 12}" font-size="14" fill="currentColor">'
+                     f'{html.escape(label)} {share * 100:.1f}%</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def _render_mermaid_flowchart(direction, lines):
+    """将 Mermaid 流程图渲染为 SVG，按最长路径分层布局"""
+    labels, shapes, order, edges = {}, {}, [], []
+
+    def parse_node(text, pos):
+        match = _MERMAID_NODE.match(text, pos)
+        if not match:
+            return None, pos
+        node_id = match.group(1)
+        if node_id not in labels:
+            order.append(node_id)
+            labels[node_id] = node_id
+            shapes[node_id] = "rect"
+        if match.group(2):
+            shape_text = match.group(3) or match.group(4) or match.group(5) or match.group(6) or ""
+            labels[node_id] = shape_text.strip().strip('"')
+            shapes[node_id] = (
+                "circle" if match.group(3) is not None
+                else "rect" if match.group(4) is not None
+                else "round" if match.group(5) is not None
+                else "diamond"
+            )
+        return node_id, match.end()
+
+    for line in lines:
+        for statement in line.split(";"):
+            statement = statement.strip()
+            if not statement:
+                continue
+            source, pos = parse_node(statement, 0)
+            if source is None:
+                return None
+            while pos < len(statement):
+                edge = _MERMAID_EDGE.match(statement, pos)
+                if not edge:
+                    return None  # 不支持的语法交给浏览器端处理
+                target, pos = parse_node(statement, edge.end())
+                if target is None:
+                    return None
+                edges.append((source, target, edge.group(1), (edge.group(2) or "").strip()))
+                source = target
+    if not order:
+        return None
+
+    # 去掉回边后按最长路径分层
+    successors = {n: [] for n in order}
+    for source, target, _, _ in edges:
+        successors[source].append(target)
+    state, back_edges = {}, set()
+
+    def visit(node):
+        state[node] = 1
+        for nxt in successors[node]:
+            if state.get(nxt) == 1:
+                back_edges.add((node, nxt))
+            elif nxt not in state:
+                visit(nxt)
+        state[node] = 2
+
+    for node in order:
+        if node not in state:
+            visit(node)
+    layer = {n: 0 for n in order}
+    for _ in range(len(order)):
+        changed = False
+        for source, target, _, _ in edges:
+            if (source, target) not in back_edges and layer[target] < layer[source] + 1:
+                layer[target] = layer[source] + 1
+                changed = True
+        if not changed:
+            break
+
+    font_size, node_height, gap = 14, 40, 50
+    sizes = {n: (max(60.0, _svg_text_width(labels[n], font_size) + 28), node_height) for n in order}
+    layers = {}
+    for n in order:
+        layers.setdefault(layer[n], []).append(n)
+    horizontal = direction in ("LR", "RL")
+
+    # 计算每个节点中心点的坐标：主轴按层，交叉轴按层内顺序
+    main_extent = [max((sizes[n][0] if horizontal else sizes[n][1]) for n in layers[i])
+                   for i in range(len(layers))]
+    cross_extent = [sum((sizes[n][1] if horizontal else sizes[n][0]) for n in layers[i])
+                    + gap * (len(layers[i]) - 1) for i in range(len(layers))]
+    total_cross = max(cross_extent)
+    positions = {}
+    main_pos = 20.0
+    for i in range(len(layers)):
+        cross_pos = 20 + (total_cross - cross_extent[i]) / 2
+        for n in layers[i]:
+            cross_size = sizes[n][1] if horizontal else sizes[n][0]
+            center_main = main_pos + main_extent[i] / 2
+            center_cross = cross_pos + cross_size / 2
+            positions[n] = (center_main, center_cross) if horizontal else (center_cross, center_main)
+            cross_pos += cross_size + gap
+        main_pos += main_extent[i] + gap * 1.2
+    main_total = main_pos - gap * 1.2 + 20
+    width, height = (main_total, total_cross + 40) if horizontal else (total_cross + 40, main_total)
+    if direction in ("RL", "BT"):
+        positions = {
+            n: ((width - x, y) if horizontal else (x, height - y)) for n, (x, y) in positions.items()
+        }
+
+    def anchor(node, toward):
+        x, y = positions[node]
+        w, h = sizes[node]
+        if shapes[node] == "diamond":
+            w, h = w + 16, h + 16
+        tx, ty = positions[toward]
+        if horizontal:
+            return (x + w / 2 if tx > x else x - w / 2 if tx < x else x), y
+        return x, (y + h / 2 if ty > y else y - h / 2 if ty < y else y)
+
+    # 同一页面中的多个图表各自定义箭头，id 按图表内容区分
+    marker_id = "mermaid-arrow-" + content_hash(direction, lines)[:12]
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width:.0f} {height:.0f}" '
+        f'preserveAspectRatio="xMidYMid meet" font-size="{font_size}">',
+        f'<defs><marker id="{marker_id}" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="7" '
+        'markerHeight="7" orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" fill="#333"/></marker></defs>',
+    ]
+    for source, target, kind, label in edges:
+        x1, y1 = anchor(source, target)
+        x2, y2 = anchor(target, source)
+        attrs = 'stroke="#333" fill="none"'
+        attrs += ' stroke-width="3"' if kind == "==>" else ' stroke-width="1.5"'
+        if kind == "-.->":
+            attrs += ' stroke-dasharray="5,4"'
+        if kind != "---":
+            attrs += f' marker-end="url(#{marker_id})"'
+        parts.append(f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" {attrs}/>')
+        if label:
+            parts.append(
+                f'<text x="{(x1 + x2) / 2:.1f}" y="{(y1 + y2) / 2 - 4:.1f}" text-anchor="middle" '
+                f'fill="currentColor">{html.escape(label)}</text>'
+            )
+    for n in order:
+        x, y = positions[n]
+        w, h = sizes[n]
+        style = 'fill="#ECECFF" stroke="#9370DB" stroke-width="1.5"'
+        if shapes[n] == "diamond":
+            parts.append(f'<polygon points="{x:.1f},{y - h / 2 - 8:.1f} {x + w / 2 + 8:.1f},{y:.1f} '
+                         f'{x:.1f},{y + h / 2 + 8:.1f} {x - w / 2 - 8:.1f},{y:.1f}" {style}/>')
+        elif shapes[n] == "circle":
+            parts.append(f'<ellipse cx="{x:.1f}" cy="{y:.1f}" rx="{w / 2:.1f}" ry="{h / 2:.1f}" {style}/>')
+        else:
+            radius = 12 if shapes[n] == "round" else 3
+            parts.append(f'<rect x="{x - w / 2:.1f}" y="{y - h / 2:.1f}" width="{w:.1f}" height="{h:.1f}" '
+                         f'rx="{radius}" {style}/>')
+        parts.append(f'<text x="{x:.1f}" y="{y + 5:.1f}" text-anchor="middle" fill="#333">'
+                     f'{html.escape(labels[n])}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def _mermaid_lines(source: str):
+    """去掉空行和 %% 注释"""
+    return [
+        line.strip() for line in source.strip().splitlines()
+        if line.strip() and not line.strip().startswith("%%")
+    ]
+
+
+def mermaid_is_static(source: str) -> bool:
+    """图表语法是否能由 render_mermaid 预渲染为 SVG"""
+    lines = _mermaid_lines(source)
+    return bool(lines) and (_MERMAID_FLOW_HEADER.match(lines[0]) is not None or lines[0].split()[0] == "pie")
+
+
+def render_mermaid(source: str) -> str:
+    """预渲染 Mermaid 图表：支持的语法直接输出 SVG，其余按代码块显示源码（页面不加载 mermaid.js）"""
+    lines = _mermaid_lines(source)
+    svg = None
+    if lines:
+        flow_header = _MERMAID_FLOW_HEADER.match(lines[0])
+        if flow_header:
+            svg = _render_mermaid_flowchart(flow_header.group(1), lines[1:])
+        elif lines[0].split()[0] == "pie":
+            svg = _render_mermaid_pie(lines)
+    if svg is None:
+        return highlight_code(source, "mermaid")
+    return f'<div class="mermaid mermaid-static">{svg}</div>'
+
+
+def render_block(language: str, source: str) -> str:
+    """渲染单个围栏代码块，结果按内容哈希缓存"""
+    cache = get_block_cache()
+    key = content_hash(BLOCK_RENDERER_VERSION, CODE_HIGHLIGHT_STYLE, highlight is not None, language, source)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    if language == "mermaid":
+        rendered = render_mermaid(source)
+    else:
+        rendered = highlight_code(source, language)
+    cache.put(key, rendered.encode("utf-8"))
+    return rendered
+
+
+def prerender_blocks(paragraph):
+    """将段落中的围栏代码块替换为预渲染好的 HTML"""
+    if not paragraph or "```" not in paragraph:
+        return paragraph
+    output, block, fence_info = [], None, ""
+    for line in paragraph.split("\n"):
+        if block is None:
+            if line.strip().startswith("```"):
+                block, fence_info = [], line.strip()[3:].strip()
+            else:
+                output.append(line)
+        elif line.strip().startswith("```"):
+            language = fence_info.split()[0].lower() if fence_info else ""
+            output.append(render_block(language, "\n".join(block)))
+            block = None
+        else:
+            block.append(line)
+    if block is not None:
+        # 未闭合的代码块保持原样
+        output.append("```" + fence_info)
+        output.extend(block)
+    return "\n".join(output)
+
+
+class ChunkView:
+    """块结构的模板视图，段落中的代码块和图表已预渲染"""
+
+    __slots__ = ("type", "direction", "alignment", "paragraph", "children")
+
+    def __init__(self, chunk):
+        self.type = chunk.type
+        self.direction = chunk.direction
+        self.alignment = chunk.alignment
+        self.paragraph = prerender_blocks(chunk.paragraph)
+        self.children = tuple(ChunkView(child) for child in chunk.children or ())
+
+
+# Helvetica/Arial 的 ASCII 字符宽度（1/1000 em，字符 32-126）
+_HELVETICA_ASCII_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+# 常见字体相对 Helvetica 的西文字宽比例，None 表示等宽字体
+_FONT_WIDTH_SCALE = {
+    "arial": 1.0,
+    "helvetica": 1.0,
+    "sans-serif": 1.0,
+    "segoe ui": 0.97,
+    "tahoma": 0.98,
+    "geneva": 1.02,
+    "verdana": 1.12,
+    "georgia": 1.06,
+    "times new roman": 0.89,
+    "times": 0.89,
+    "serif": 0.89,
+    "microsoft yahei": 1.02,
+    "pingfang sc": 1.0,
+    "simhei": 0.9,
+    "courier new": None,
+    "courier": None,
+    "monospace": None,
+}
+
+
+@shared_resource
+def get_font_metrics(font_stack: str):
+    """按字体栈中第一个已知字体生成 BMP 字符宽度表（单位 em）"""
+    scale = 1.0
+    for family in font_stack.split(","):
+        family = family.strip().strip("'\"").lower()
+        if family in _FONT_WIDTH_SCALE:
+            scale = _FONT_WIDTH_SCALE[family]
+            break
+
+    widths = np.empty(0x10000, dtype=np.float32)
+    for code in range(0x10000):
+        char = chr(code)
+        if unicodedata.combining(char) or unicodedata.category(char) in ("Cc", "Cf", "Mn"):
+            widths[code] = 0.0
+        elif unicodedata.east_asian_width(char) in "WF":
+            widths[code] = 1.0  # 中日韩文字和全角标点
+        else:
+            widths[code] = 0.6 if scale is None else 0.55 * scale
+    if scale is not None:
+        widths[32:127] = np.array(_HELVETICA_ASCII_WIDTHS, dtype=np.float32) / 1000 * scale
+    return widths
+
+
+def _plain_text(line: str) -> str:
+    """去掉行内 Markdown 标记，只保留会显示出来的文字"""
+    line = re.sub(r"!?\[([^\]]*)\]\([^)]*\)", r"\1", line)
+    return re.sub(r"\*\*|__|[*_`~]", "", line)
+
+
+class _FitBatch:
+    """收集整个演示文稿中待测量的文本行，统一做向量化计算"""
+
+    def __init__(self):
+        self.texts = []
+        self.font_px = []
+        self.line_px = []
+        self.width_px = []
+        self.wraps = []
+        self.owner = []
+        self.page = []
+        self.heading = []
+        self.fixed_px = []  # 每个盒子中不随文字变化的高度：边距、图片等
+        self.box_page = []
+
+    def new_box(self, page_index, fixed_px=0.0):
+        self.fixed_px.append(fixed_px)
+        self.box_page.append(page_index)
+        return len(self.fixed_px) - 1
+
+    def add_line(self, box, text, font_px, line_px, width_px, wraps=True, heading=False):
+        self.texts.append(text)
+        self.font_px.append(font_px)
+        self.line_px.append(line_px)
+        self.width_px.append(width_px)
+        self.wraps.append(wraps)
+        self.owner.append(box)
+        self.page.append(self.box_page[box])
+        self.heading.append(heading)
+
+    def add_paragraph(self, page_index, paragraph, width_px):
+        """按幻灯片样式拆分段落：正文 28px、列表 26px、代码 20px，图片和图表按最小尺寸计"""
+        box = self.new_box(page_index)
+        in_code, diagram = False, None
+
+        def close_diagram():
+            # 不能预渲染为 SVG 的图表按代码块显示
+            if mermaid_is_static("\n".join(diagram)):
+                self.fixed_px[box] += FIT_MIN_ELEMENT_PX
+            else:
+                self.fixed_px[box] += 40
+                for _ in diagram:
+                    self.add_line(box, "", 20, 30, width_px, wraps=False)
+
+        for line in (paragraph or "").strip("\n").split("\n"):
+            stripped = line.strip()
+            if stripped.startswith("```"):
+                if not in_code:
+                    in_code = True
+                    if stripped[3:].strip().lower().startswith("mermaid"):
+                        diagram = []
+                    else:
+                        self.fixed_px[box] += 40
+                else:
+                    in_code = False
+                    if diagram is not None:
+                        close_diagram()
+                        diagram = None
+                continue
+            if in_code:
+                if diagram is not None:
+                    diagram.append(line)
+                else:
+                    self.add_line(box, "", 20, 30, width_px, wraps=False)
+            elif re.match(r"^\s*!\[.*\]\(.*\)\s*$", line):
+                self.fixed_px[box] += FIT_MIN_ELEMENT_PX
+            elif re.match(r"^\s*([-*+]|\d+\.)\s+", line):
+                self.add_line(box, _plain_text(stripped), 26, 39, width_px - 30)
+            else:
+                self.add_line(box, _plain_text(stripped), 28, 42, width_px)
+        if diagram is not None:
+            close_diagram()
+        return box
+
+
+def _collect_chunk(batch, page_index, chunk, width_px):
+    """展开块结构：水平方向平分宽度取最高，垂直方向高度相加"""
+    if chunk.type == "paragraph":
+        return ("box", batch.add_paragraph(page_index, chunk.paragraph, width_px))
+    children = chunk.children or []
+    if chunk.direction == "vertical":
+        return ("v", [_collect_chunk(batch, page_index, c, width_px) for c in children])
+    gap_total = 20 * max(len(children) - 1, 0)
+    child_width = (width_px - gap_total) / max(len(children), 1)
+    return ("h", [_collect_chunk(batch, page_index, c, child_width) for c in children])
+
+
+def _tree_height(tree, box_heights):
+    kind, value = tree
+    if kind == "box":
+        return box_heights[value]
+    heights = [_tree_height(child, box_heights) for child in value]
+    if not heights:
+        return 0.0
+    return sum(heights) if kind == "v" else max(heights)
+
+
+def _fit_measure(pages, theme: str = "default"):
+    """收集各页的文字行，返回 measure(scales) -> (各页内容高度, 各页可用高度)，单位 px
+
+    内容高度是缩放前 .auto-sizing 内的高度，缩小后容器相应加宽、折行减少，所以依赖缩放比例；
+    可用高度是幻灯片扣除标题和底部留白后的高度，标题不参与缩放。
+    """
+    fonts = THEMES.get(theme, THEMES["default"])["fonts"]
+    batch = _FitBatch()
+    trees, heading_boxes = [], []
+    for i, page in enumerate(pages):
+        heading_box = batch.new_box(i)
+        for text, font_px, extra_px in (
+            (page.h1, 40, 40),     # h1: 2.5em，上下外边距各 20px
+            (page.h2, 32, 83),     # h2: 2em，上下内边距 15px，默认外边距 0.83em
+            (page.h3, 27.2, 54),   # h3: 1.7em，默认外边距 1em
+        ):
+            if text:
+                batch.fixed_px[heading_box] += extra_px
+                batch.add_line(heading_box, text, font_px, font_px * 1.2, SLIDE_WIDTH - 40, heading=True)
+        heading_boxes.append(heading_box)
+        trees.append(_collect_chunk(batch, i, page.chunk, FIT_CONTENT_WIDTH))
+
+    # 所有行的文字拼成一个码点数组，一次查表得到每行的宽度（em）
+    body_metrics = get_font_metrics(fonts["body"])
+    heading_metrics = get_font_metrics(fonts["heading"])
+    heading_line = np.asarray(batch.heading, dtype=bool)
+    lengths = np.fromiter((len(t) for t in batch.texts), dtype=np.int64, count=len(batch.texts))
+    codes = np.frombuffer("".join(batch.texts).encode("utf-32-le"), dtype=np.uint32)
+    line_of_char = np.repeat(np.arange(len(batch.texts)), lengths)
+    clipped = np.minimum(codes, 0xFFFF)
+    char_em = np.where(
+        heading_line[line_of_char], heading_metrics[clipped], body_metrics[clipped]
+    )
+    char_em = np.where(codes > 0xFFFF, 1.0, char_em)
+    line_em = np.bincount(line_of_char, weights=char_em, minlength=len(batch.texts))
+
+    font_px = np.asarray(batch.font_px, dtype=np.float64)
+    line_px = np.asarray(batch.line_px, dtype=np.float64)
+    width_px = np.maximum(np.asarray(batch.width_px, dtype=np.float64), 1.0)
+    wraps = np.asarray(batch.wraps, dtype=bool)
+    owner = np.asarray(batch.owner, dtype=np.int64)
+    line_page = np.asarray(batch.page, dtype=np.int64)
+    fixed_px = np.asarray(batch.fixed_px, dtype=np.float64)
+    text_px = line_em * font_px
+    heading_boxes = np.asarray(heading_boxes, dtype=np.int64)
+
+    def measure(scales):
+        available = width_px / np.where(heading_line, 1.0, scales[line_page])
+        lines = np.where(wraps, np.maximum(np.ceil(text_px / available), 1.0), 1.0)
+        box_heights = fixed_px + np.bincount(owner, weights=lines * line_px, minlength=len(fixed_px))
+        needed = np.fromiter((_tree_height(tree, box_heights) for tree in trees), dtype=np.float64, count=len(trees))
+        return needed, SLIDE_HEIGHT - FIT_BOTTOM_MARGIN - box_heights[heading_boxes]
+
+    return measure
+
+
+def compute_fit_scales(pages, theme: str = "default", iterations: int = 12):
+    """估算每页内容所需的缩放比例，使其容纳在 960x540 的幻灯片中
+
+    缩放比例越小内容越矮（容器加宽后折行只会减少），所以按页二分查找
+    needed(s) * s <= available 成立的最大比例，iterations 为二分次数；
+    最小比例下仍放不下时取 MIN_FIT_SCALE。
+    """
+    if not pages:
+        return []
+    measure = _fit_measure(pages, theme)
+    needed, available = measure(np.ones(len(pages)))
+    fits = (needed <= available) & (available > 0)
+    low = np.where(fits, 1.0, MIN_FIT_SCALE)
+    high = np.ones(len(pages))
+    for _ in range(iterations):
+        if np.all(high - low < 0.001):
+            break
+        middle = (low + high) / 2
+        needed, available = measure(middle)
+        ok = needed * middle <= available
+        low = np.where(ok, middle, low)
+        high = np.where(ok, high, middle)
+    return [float(np.floor(s * 1000) / 1000) for s in low]
+
+
+@shared_resource
+def get_compose_pool():
+    """并行拆分页面所用的进程池"""
+    return ProcessPoolExecutor(
+        max_workers=COMPOSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def split_document_segments(content: str, target_chars: int):
+    """在代码块之外的 --- 分隔线处把文档切成若干段，每段约 target_chars 个字符
+
+    分隔线之后紧跟装饰行（@(...)）的位置不切分，因为 composite 对这种情况
+    的处理依赖前一段的标题层级。
+    """
+    lines = content.split("\n")
+    segments, current, size = [], [], 0
+    in_code = False
+    for i, line in enumerate(lines):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if (
+            not in_code
+            and size >= target_chars
+            and is_divider(line, type="-")
+            and not contains_deco(next((l for l in lines[i + 1:] if l.strip()), ""))
+        ):
+            segments.append("\n".join(current))
+            current, size = [], 0
+            continue
+        current.append(line)
+        size += len(line) + 1
+    segments.append("\n".join(current))
+    return [segment for segment in segments if segment.strip()]
+
+
+def split_stable_segments(content: str, slides_per_segment: int = DECK_SEGMENT_SLIDES):
+    """按内容决定切分位置，把文档切成平均每段 slides_per_segment 张幻灯片
+
+    是否在某条分隔线处切分只取决于它前面那一张幻灯片的内容，修改一张幻灯片最多影响
+    它所在的段和相邻的段，其余各段的文本不变，可以命中按内容缓存的拆分结果。
+    与 split_document_segments 一样不在代码块内和装饰行之前切分。
+    """
+    lines = content.split("\n")
+    segments, current, slide_start = [], [], 0
+    in_code = False
+    for i, line in enumerate(lines):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if not in_code and "---" in line and is_divider(line, type="-"):
+            slide = "\n".join(current[slide_start:]).encode("utf-8")
+            if zlib.crc32(slide) % slides_per_segment == 0 and not contains_deco(
+                next((lines[j] for j in range(i + 1, len(lines)) if lines[j].strip()), "")
+            ):
+                segments.append("\n".join(current))
+                current, slide_start = [], 0
+                continue
+            slide_start = len(current) + 1
+        current.append(line)
+    segments.append("\n".join(current))
+    return [segment for segment in segments if segment.strip()]
+
+
+def inherit_headings(pages):
+    """按页面选项从前面的页面继承标题，与 composite 最后一步的规则一致"""
+    env_h1 = env_h2 = env_h3 = None
+    for page in pages:
+        inherit_h1 = page.option.default_h1
+        inherit_h2 = page.option.default_h2
+        inherit_h3 = page.option.default_h3
+        if page.h1 is not None:
+            env_h1 = page.h1
+            env_h2 = env_h3 = None
+            inherit_h1 = inherit_h2 = inherit_h3 = False
+        if page.h2 is not None:
+            env_h2 = page.h2
+            env_h3 = None
+            inherit_h2 = inherit_h3 = False
+        if page.h3 is not None:
+            env_h3 = page.h3
+            inherit_h3 = False
+        if inherit_h1:
+            page.h1 = env_h1
+        if inherit_h2:
+            page.h2 = env_h2
+        if inherit_h3:
+            page.h3 = env_h3
+    return pages
+
+
+def changes_heading_inheritance(document: str) -> bool:
+    """文档中是否有装饰行修改标题继承选项，这种情况无法分段拆分后再还原"""
+    return re.search(r"^\s*@\(.*default_h[123].*\)\s*$", document, re.MULTILINE) is not None
+
+
+def segment_front_matter(document: str):
+    """生成分段拆分用的 front matter：沿用文档的选项，但关闭标题继承
+
+    front matter 无法安全地重新生成时返回 None。
+    """
+    front_matter = {}
+    stripped = document.strip()
+    if stripped.startswith("---") and len(stripped.split("---", 2)) >= 3:
+        try:
+            front_matter = yaml.safe_load(stripped.split("---", 2)[1].strip()) or {}
+        except yaml.YAMLError:
+            front_matter = {}
+    if not isinstance(front_matter, dict):
+        return None
+    front_matter.update(default_h1=False, default_h2=False, default_h3=False)
+    header = yaml.safe_dump(front_matter, allow_unicode=True)
+    if "---" in header:
+        return None
+    return f"---\n{header}---\n"
+
+
+def restore_heading_inheritance(pages, options):
+    """恢复文档原本的标题继承选项，并对合并后的页面统一做一次标题继承"""
+    for page in pages:
+        page.option.default_h1 = options.default_h1
+        page.option.default_h2 = options.default_h2
+        page.option.default_h3 = options.default_h3
+    return inherit_headings(pages)
+
+
+def composite_parallel(document: str, workers: int = None):
+    """多进程拆分页面，结果与 composite(document) 完全一致
+
+    各段在子进程中关闭标题继承后单独拆分，合并后再按原始选项统一做一次标题继承，
+    这样跨段的标题沿用与串行拆分相同。
+    """
+    document = rm_comments(document)
+    if changes_heading_inheritance(document):
+        return composite(document)
+    content, options = parse_frontmatter(document)
+    header = segment_front_matter(document)
+    if header is None:
+        return composite(document)
+
+    workers = workers or COMPOSE_WORKERS
+    target_chars = max(len(content) // (workers * 2), PARALLEL_COMPOSE_MIN_SEGMENT_CHARS)
+    segments = split_document_segments(content, target_chars)
+    if len(segments) < 2:
+        return composite(document)
+
+    pages = []
+    for segment_pages in get_compose_pool().map(composite, [header + s for s in segments]):
+        pages.extend(segment_pages)
+    return restore_heading_inheritance(pages, options)
+
+
+def compose_document(document: str, parallel: bool = None):
+    """将 Markdown 文档拆分为页面，结果按文档内容缓存
+
+    parallel 为 None 时按文档长度自动选择串行或多进程拆分。
+    """
+    cache = get_compose_cache()
+    key = content_hash(document)
+    pages = cache.get(key)
+    if pages is None:
+        if parallel is None:
+            parallel = len(document) >= PARALLEL_COMPOSE_MIN_CHARS and COMPOSE_WORKERS > 1
+        with profile_stage("composite"):
+            pages = composite_parallel(document) if parallel else composite(document)
+        cache.put(key, pages)
+    return pages
+
+
+def intern_text(text):
+    """驻留标题字符串，相同标题在所有页面间共用一个对象"""
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+class SlideView:
+    """单页幻灯片的模板数据，块结构在模板访问时才构造"""
+
+    __slots__ = ("h1", "h2", "h3", "layout", "styles", "fit_scale", "_page", "_chunk")
+
+    def __init__(self, page, fit_scale: float = 1.0):
+        self.h1 = intern_text(page.h1)
+        self.h2 = intern_text(page.h2)
+        self.h3 = intern_text(page.h3)
+        self.layout = getattr(page.option, 'layout', 'content')
+        self.styles = getattr(page.option, 'styles', {})  # 直接引用页面选项，不复制
+        self.fit_scale = fit_scale
+        self._page = page
+        self._chunk = None
+
+    @property
+    def chunk(self) -> ChunkView:
+        if self._chunk is None:
+            self._chunk = ChunkView(self._page.chunk)
+        return self._chunk
+
+
+def slide_fragment_key(page, theme: str = "default") -> str:
+    """单页幻灯片片段的缓存键，只取决于页面内容和主题字体"""
+    return content_hash(
+        THEMES.get(theme, THEMES["default"])["fonts"],
+        page.h1,
+        page.h2,
+        page.h3,
+        page.raw_md,
+        getattr(page.option, 'layout', 'content'),
+        sorted(getattr(page.option, 'styles', {}).items()),
+    )
+
+
+def number_fragment(fragment: str, number: int) -> str:
+    """填入片段中的页码"""
+    return fragment.replace(SLIDE_NUMBER_PLACEHOLDER, str(number), 1)
+
+
+def render_slide_fragments(pages, theme: str = "default", start=0, stop=None, cache=None, numbered=True,
+                           checkpoint=None):
+    """渲染 [start, stop) 范围内的幻灯片片段，已渲染过的直接从缓存读取
+
+    缓存的片段不含页码，插入或删除幻灯片时其余页面仍能命中缓存；
+    numbered 为 False 时返回保留页码占位符的片段。
+    checkpoint 在渲染每张幻灯片之前调用，抛出异常即可中止渲染。
+    """
+    if cache is None:
+        cache = get_fragment_cache()
+    template = compile_template(SLIDE_TEMPLATE)
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    indices = range(max(start, 0), stop)
+    keys = {i: slide_fragment_key(pages[i], theme) for i in indices}
+    fragments = {i: cache.get(keys[i]) for i in indices}
+
+    # 未命中缓存的页面一起估算缩放比例
+    missing = [i for i in indices if fragments[i] is None]
+    with profile_stage("fit"):
+        scales = compute_fit_scales([pages[i] for i in missing], theme)
+    with profile_stage("render"):
+        for i, fit_scale in zip(missing, scales):
+            if checkpoint is not None:
+                checkpoint()
+            fragments[i] = template.render(slide=SlideView(pages[i], fit_scale), number=SLIDE_NUMBER_PLACEHOLDER)
+            cache.put(keys[i], fragments[i])
+    if not numbered:
+        return [fragments[i] for i in indices]
+    return [number_fragment(fragments[i], i + 1) for i in indices]
+
+
+def prefetch_slide_fragments(pages, theme: str, start, stop):
+    """在后台预先渲染相邻范围的幻灯片片段"""
+    start, stop = max(start, 0), min(stop, len(pages))
+    if start >= stop:
+        return None
+    return get_prefetch_executor().submit(
+        render_slide_fragments, pages, theme, start, stop, get_fragment_cache()
+    )
+
+
+def assemble_deck_html(fragments, theme: str = "default", title: str = "Untitled", **extra) -> str:
+    """将幻灯片片段拼装为完整的 HTML 页面"""
+    template = compile_template(DECK_TEMPLATE)
     data = {
         "title": title,
-        "struct": slide_struct,
-        "slide_width": width,
-        "slide_height": height,
-        "css_content": css_content,
-        "slides": [
-            {
-                "h1": page.h1,
-                "h2": page.h2,
-                "h3": page.h3,
-                "chunk": page.chunk.__dict__,  # 简化处理
-                "layout": page.option.layout if hasattr(page.option, 'layout') else 'content',
-                "styles": getattr(page.option, 'styles', {}),
-            }
-            for page in pages
-        ],
+        "css_content": get_theme_css(theme),
+        "deck_script": DECK_SCRIPT,
+        "fragments": fragments,
     }
+    data.update(extra)
+    with profile_stage("render"):
+        return template.render(data)
+
+
+def render_slide_range(document: str, theme: str = "default", start: int = 0, stop: int = None) -> str:
+    """只渲染部分幻灯片，用于分页预览"""
+    pages = compose_document(document)
+    fragments = render_slide_fragments(pages, theme, start, stop)
+    title = extract_title(document) or "Untitled"
+    return assemble_deck_html(fragments, theme, title)
+
+
+def render_pages(pages, theme: str = "default", title: str = "Untitled", embed_fonts: bool = False,
+                 compact: bool = False, index: bool = False, source: str = "") -> str:
+    """将拆分好的页面渲染为完整的 HTML；embed_fonts 为 True 时内嵌所用字符的子集字体，
+    compact 为 True 时输出由浏览器渲染的紧凑格式。
+
+    index 为 True 时同时在后台更新检索索引，source 为来源文件；默认不写索引，
+    渲染服务等无状态的调用方不会产生副作用。
+    """
+    if index:
+        index_deck_async(pages, title, source)
+    if compact:
+        return render_compact_deck(pages, theme, title, embed_fonts)
+    fragments = render_slide_fragments(pages, theme)
+
+    return assemble_deck_html(
+        fragments,
+        theme,
+        title,
+        font_css=embedded_font_css(theme, fragments)[0] if embed_fonts else "",
+    )
+
+
+def render_jinja2(document: str, theme: str = "default", embed_fonts: bool = False, compact: bool = False) -> str:
+    """使用 Jinja2 模板渲染 HTML"""
+    # 填充模板
+    pages = compose_document(document)
+    title = extract_title(document) or "Untitled"
+    return render_pages(pages, theme, title, embed_fonts, compact)
+
+
+def deck_model(pages, theme: str = "default") -> dict:
+    """将页面序列化为紧凑的 JSON 模型，由 DECK_MODEL_RUNTIME 在浏览器中渲染
+
+    标题、预渲染后的段落和行内样式存入字符串表，其余位置只存下标，下标 0 为空字符串。
+    块结构为嵌套数组：段落是字符串下标，节点是 [是否纵向, 子块...]。
+    每页为 [h1, h2, h3, 块结构, 样式, 是否居中, 缩放比例]，末尾取默认值的项省略。
+    页面模板不使用 retrieve_structure 的结果，模型中不存储。
+    """
+    strings, string_ids = [""], {"": 0}
+
+    def ref(text):
+        if not text:
+            return 0
+        index = string_ids.get(text)
+        if index is None:
+            index = string_ids[text] = len(strings)
+            strings.append(text)
+        return index
+
+    def encode_chunk(chunk):
+        if chunk.type == "paragraph":
+            # 与模板一致：None 输出为 "None"
+            return ref(str(chunk.paragraph))
+        if chunk.type == "node":
+            return [int(chunk.direction == "vertical"), *(encode_chunk(child) for child in chunk.children)]
+        return None
+
+    with profile_stage("fit"):
+        scales = compute_fit_scales(pages, theme)
+    slides = []
+    with profile_stage("render"):
+        for page, fit_scale in zip(pages, scales):
+            view = SlideView(page, fit_scale)
+            style = "".join(f"{key}: {value}; " for key, value in view.styles.items())
+            slide = [ref(view.h1), ref(view.h2), ref(view.h3), encode_chunk(view.chunk),
+                     ref(style), int(view.layout == "centered"), fit_scale]
+            while len(slide) > 4 and slide[-1] == (1.0 if len(slide) == 7 else 0):
+                slide.pop()
+            slides.append(slide)
+
+    return {"version": DECK_MODEL_VERSION, "strings": strings, "slides": slides}
+
+
+def deck_model_json(model: dict) -> str:
+    """序列化 deck_model，结果可以直接放入 <script type="application/json">"""
+    model_json = json.dumps(model, ensure_ascii=False, separators=(",", ":"))
+    # </ 和 <!-- 会提前结束脚本块或改变其解析方式
+    return model_json.replace("</", "<\\/").replace("<!--", "<\\u0021--")
+
+
+def render_compact_deck(pages, theme: str = "default", title: str = "Untitled", embed_fonts: bool = False) -> str:
+    """紧凑格式：内嵌 deck_model 和渲染脚本，显示效果与 render_pages 相同"""
+    model = deck_model(pages, theme)
+    template = compile_template(DECK_MODEL_TEMPLATE)
+    with profile_stage("render"):
+        return template.render(
+            title=title,
+            css_content=get_theme_css(theme),
+            font_css=embedded_font_css(theme, model["strings"])[0] if embed_fonts else "",
+            model_json=deck_model_json(model),
+            model_runtime=DECK_MODEL_RUNTIME + DECK_MODEL_BOOTSTRAP,
+            deck_script=DECK_SCRIPT,
+            model_script=DECK_MODEL_SCRIPT,
+        )
+
+
+def _write_file_atomic(path: str, data: bytes):
+    """先写临时文件再替换，避免读到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def export_split_deck(pages, out_dir: str, theme: str = "default", title: str = "Untitled", prune: bool = True,
+                      embed_fonts: bool = False):
+    """拆分导出：index.html 入口、每张幻灯片一个片段文件、共用的样式表和脚本
+
+    文件名取内容哈希，幻灯片不变时文件名也不变，CDN 和浏览器缓存可以按文件复用；
+    片段中不含页码，插入或删除幻灯片不影响其余幻灯片的文件。
+    片段通过 fetch 加载，需要经由 HTTP 访问。
+    返回 {"index", "slides", "written", "reused", "removed"} 统计信息。
+    """
+    slides_dir = os.path.join(out_dir, "slides")
+    os.makedirs(slides_dir, exist_ok=True)
+    env = get_jinja_env()
+    fragments = render_slide_fragments(pages, theme, numbered=False)
+    stylesheet = get_theme_css(theme)
+    if embed_fonts:
+        stylesheet += "\n" + embedded_font_css(theme, fragments)[0]
+    assets = {
+        "stylesheet": ("styles", ".css", stylesheet),
+        "script": ("deck", ".js", DECK_SCRIPT + env.from_string(SPLIT_DECK_SCRIPT).render(
+            placeholder=json.dumps(SLIDE_NUMBER_PLACEHOLDER))),
+    }
+    stats = {"slides": len(pages), "written": 0, "reused": 0, "removed": 0}
+
+    def write_hashed(directory, prefix, suffix, text):
+        data = text.encode("utf-8")
+        name = f"{prefix}{content_hash(data)[:16]}{suffix}"
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            stats["reused"] += 1
+        else:
+            _write_file_atomic(path, data)
+            stats["written"] += 1
+        return name
+
+    names = {key: write_hashed(out_dir, prefix + "-", suffix, text) for key, (prefix, suffix, text) in assets.items()}
+    slide_files = [
+        "slides/" + write_hashed(slides_dir, "", ".html", fragment)
+        for fragment in fragments
+    ]
+    index_html = env.from_string(SPLIT_DECK_TEMPLATE).render(
+        title=title, slide_files=slide_files, **names
+    )
+    # 入口页面最后写入，写完之前旧入口引用的文件都还在
+    index_path = os.path.join(out_dir, "index.html")
+    _write_file_atomic(index_path, index_html.encode("utf-8"))
+    stats["index"] = index_path
+
+    if prune:
+        referenced = set(names.values()) | {os.path.basename(src) for src in slide_files}
+        stale = [os.path.join(slides_dir, name) for name in os.listdir(slides_dir)
+                 if name.endswith(".html") and name not in referenced]
+        stale += [os.path.join(out_dir, name) for name in os.listdir(out_dir)
+                  if re.fullmatch(r"(styles-[0-9a-f]{16}\.css|deck-[0-9a-f]{16}\.js)", name)
+                  and name not in referenced]
+        for path in stale:
+            os.remove(path)
+        stats["removed"] = len(stale)
+    return stats
+
+
+# 演示文稿中引用本地图片的 <img src>，网络地址和 data URI 不处理
+_IMG_SRC = re.compile(r"""(<img\b[^>]*?\bsrc\s*=\s*)(["'])(.*?)\2""", re.I | re.S)
+_MD_IMAGE = re.compile(r"""(!\[[^\]]*\]\()([^)\s]+)((?:\s+"[^"]*")?\))""")
+# 已经压缩过的资源在 ZIP 中直接存储
+_STORED_SUFFIXES = {".woff", ".woff2", ".png", ".jpg", ".jpeg", ".gif", ".webp"}
+
+
+class _BundleWriter:
+    """向 ZIP 流式写入文件，共用资源按内容哈希命名、只写一次"""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.assets = {}  # 包内路径 -> 单独导出时每次引用占用的字节数
+        self.bytes_written = 0
+
+    def write(self, name: str, data: bytes):
+        suffix = os.path.splitext(name)[1].lower()
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if suffix in _STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+        with self.archive.open(info, "w") as f:
+            f.write(data)
+        self.bytes_written += len(data)
+
+    def asset(self, data: bytes, suffix: str, standalone_bytes: int = None) -> str:
+        """写入共用资源，返回包内路径；standalone_bytes 为单独导出时内嵌该资源的大小"""
+        name = f"assets/{content_hash(data)[:16]}{suffix}"
+        if name not in self.assets:
+            self.write(name, data)
+            self.assets[name] = len(data) if standalone_bytes is None else standalone_bytes
+        return name
+
+    def file_asset(self, path: str) -> str:
+        """复制本地文件，先流式计算哈希，再分块写入"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        suffix = os.path.splitext(path)[1].lower()
+        name = f"assets/{digest.hexdigest()[:16]}{suffix}"
+        if name not in self.assets:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED if suffix in _STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+            with open(path, "rb") as source, self.archive.open(info, "w", force_zip64=True) as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+            size = os.path.getsize(path)
+            self.bytes_written += size
+            self.assets[name] = size
+        return name
+
+
+def _bundle_images(text: str, base_dir: str, writer: _BundleWriter, used: set) -> str:
+    """把引用本地图片的 <img src> 和 Markdown 图片链接改为指向包内的共用资源"""
+    if "<img" not in text and "<IMG" not in text and "![" not in text:
+        return text
+
+    def bundled(src):
+        if re.match(r"^([a-z][a-z0-9+.-]*:|//|#)", src, re.I):
+            return None
+        path = os.path.normpath(os.path.join(base_dir, src.split("?", 1)[0].split("#", 1)[0]))
+        if not os.path.isfile(path):
+            return None
+        name = writer.file_asset(path)
+        used.add(name)
+        return f"../{name}"
+
+    def replace_tag(match):
+        target = bundled(html.unescape(match.group(3)))
+        if target is None:
+            return match.group(0)
+        return f"{match.group(1)}{match.group(2)}{target}{match.group(2)}"
+
+    def replace_markdown(match):
+        target = bundled(match.group(2))
+        if target is None:
+            return match.group(0)
+        return f"{match.group(1)}{target}{match.group(3)}"
+
+    return _MD_IMAGE.sub(replace_markdown, _IMG_SRC.sub(replace_tag, text))
+
+
+def export_bundle(deck_paths, out_path: str, theme: str = "default", embed_fonts: bool = False,
+                  compact: bool = False, builder=None):
+    """把多个演示文稿打包为一个 ZIP：目录页、每个演示文稿一个 HTML，以及共用的资源
+
+    样式表、脚本、内嵌字体和本地图片按内容哈希存放在 assets/ 下，所有演示文稿共用一份；
+    内嵌字体按全部演示文稿用到的字符一起裁剪。演示文稿逐个渲染后直接写入压缩包，
+    压缩包先写入临时文件，完成后再替换 out_path。
+    返回统计信息，separate_bytes 为每个演示文稿单独导出（资源各自内嵌）的未压缩总大小，
+    bundle_bytes 为包内文件的未压缩总大小，saved_bytes 为两者之差。
+    """
+    builder = builder or get_deck_builder()
+    env = get_jinja_env()
+    builds = [builder.build(path) for path in deck_paths]
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    stats = {"decks": len(builds), "slides": 0, "asset_refs": 0, "separate_bytes": 0}
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            writer = _BundleWriter(archive)
+            css = get_theme_css(theme).encode("utf-8")
+            script = (DECK_MODEL_RUNTIME + DECK_MODEL_BOOTSTRAP + DECK_SCRIPT + DECK_MODEL_SCRIPT
+                      if compact else DECK_SCRIPT).encode("utf-8")
+            shared = [writer.asset(css, ".css"), writer.asset(script, ".js")]
+            if embed_fonts:
+                # 片段已在片段缓存中，这里只多持有一份引用
+                fragments = [
+                    fragment for build in builds
+                    for fragment in render_slide_fragments(build.pages, theme, numbered=False)
+                ]
+                inline_sizes = {}
+
+                def font_url(data, flavor):
+                    name = writer.asset(data, "." + flavor, len(base64.b64encode(data)) + len(flavor) + 18)
+                    inline_sizes[name] = writer.assets[name]
+                    return os.path.basename(name)
+
+                font_css, _ = embedded_font_css(theme, fragments, font_url)
+                del fragments
+                if font_css:
+                    shared.append(writer.asset(font_css.encode("utf-8"), ".css"))
+                    shared.extend(inline_sizes)
+            stylesheets = ["../" + name for name in shared if name.endswith(".css")]
+            script_src = "../" + shared[1]
+
+            decks, names = [], set()
+            for build in builds:
+                stem = re.sub(r"[^\w.-]+", "_", os.path.splitext(os.path.basename(build.path))[0]) or "deck"
+                name, n = stem, 1
+                while name in names:
+                    n += 1
+                    name = f"{stem}-{n}"
+                names.add(name)
+                used = set(shared)
+                if compact:
+                    model = deck_model(build.pages, theme)
+                    rewritten = set()
+                    for i, slide in enumerate(model["slides"]):
+                        base_dir = os.path.dirname(build.sources[i])
+                        stack = [slide[3]]
+                        while stack:
+                            chunk = stack.pop()
+                            if isinstance(chunk, list):
+                                stack.extend(chunk[1:])
+                            elif isinstance(chunk, int) and chunk not in rewritten:
+                                rewritten.add(chunk)
+                                model["strings"][chunk] = _bundle_images(
+                                    model["strings"][chunk], base_dir, writer, used)
+                    fragments, model_json = [], deck_model_json(model)
+                else:
+                    fragments = [
+                        _bundle_images(fragment, os.path.dirname(build.sources[i]), writer, used)
+                        for i, fragment in enumerate(render_slide_fragments(build.pages, theme))
+                    ]
+                    model_json = ""
+                data = env.from_string(BUNDLE_DECK_TEMPLATE).render(
+                    title=build.title, stylesheets=stylesheets, fragments=fragments,
+                    model_json=model_json, script=script_src,
+                ).encode("utf-8")
+                writer.write(f"decks/{name}.html", data)
+                index_deck_async(build.pages, build.title, build.path)
+                decks.append({"href": f"decks/{name}.html", "title": build.title, "slides": len(build.pages)})
+                stats["slides"] += len(build.pages)
+                stats["asset_refs"] += len(used)
+                stats["separate_bytes"] += len(data) + sum(writer.assets[asset] for asset in used)
+
+            writer.write("index.html", env.from_string(BUNDLE_INDEX_TEMPLATE).render(decks=decks).encode("utf-8"))
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    stats.update(
+        assets=len(writer.assets),
+        bundle_bytes=writer.bytes_written,
+        saved_bytes=stats["separate_bytes"] - writer.bytes_written,
+        archive_bytes=os.path.getsize(out_path),
+        path=out_path,
+    )
+    return stats
+
+
+class DeckStore:
+    """渲染好的完整演示文稿存放在磁盘上，会话状态中只保存句柄
+
+    所有会话共用一个总字节预算，超出时按最近使用顺序删除文件；
+    句柄被淘汰后 get 返回 None，由调用方重新渲染。内容只在下载时读入内存。
+    """
+
+    def __init__(self, directory: str, budget_bytes: int):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()  # 句柄 -> 字节数，最近使用的在最后
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    def _path(self, handle):
+        if not re.fullmatch(r"[0-9a-f]{16,64}", handle):
+            raise ValueError(f"无效的句柄: {handle!r}")
+        return os.path.join(self.directory, handle)
+
+    def _load_existing(self):
+        """进程重启后沿用已有文件，按修改时间恢复使用顺序"""
+        existing = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            existing.append((stat.st_mtime, name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(existing):
+                self._entries[name] = size
+                self._total += size
+            self._evict()
+
+    def put(self, data, handle: str = None) -> str:
+        """保存内容并返回句柄；handle 为空时按内容生成，相同内容只存一份"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        handle = handle or content_hash(data)[:40]
+        path = self._path(handle)
+        with self._lock:
+            if handle in self._entries and os.path.exists(path):
+                self._entries.move_to_end(handle)
+                return handle
+        _write_file_atomic(path, data)
+        with self._lock:
+            self._total += len(data) - self._entries.pop(handle, 0)
+            self._entries[handle] = len(data)
+            self._evict()
+        return handle
+
+    def get(self, handle: str):
+        """读取内容，已被淘汰时返回 None"""
+        with self._lock:
+            if handle not in self._entries:
+                return None
+            self._entries.move_to_end(handle)
+        path = self._path(handle)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._total -= self._entries.pop(handle, 0)
+            return None
+        return data
+
+    def __contains__(self, handle):
+        with self._lock:
+            return handle in self._entries
+
+    def _evict(self):
+        # 调用方持有锁；最新保存的一项即使超出预算也保留
+        while self._total > self.budget_bytes and len(self._entries) > 1:
+            handle, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.directory, handle))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total, "budget_bytes": self.budget_bytes}
+
+
+@shared_resource
+def get_deck_store():
+    """进程内共享的演示文稿存储"""
+    return DeckStore(os.path.join(CACHE_DIR, "decks"), DECK_STORE_BUDGET_BYTES)
+
+
+def deck_handle(markdown_content: str, theme: str, embed_fonts: bool = False, compact: bool = False) -> str:
+    """完整 HTML 在存储中的句柄，只取决于内容、主题配置和导出选项"""
+    theme_config = THEMES.get(theme, THEMES["default"])
+    return content_hash("deck", markdown_content, theme, theme_config, embed_fonts, compact)[:40]
+
+
+def load_deck_html(markdown_content: str, theme: str, embed_fonts: bool = False, compact: bool = False) -> bytes:
+    """从存储读取完整 HTML，已被淘汰时重新渲染"""
+    store = get_deck_store()
+    handle = deck_handle(markdown_content, theme, embed_fonts, compact)
+    data = store.get(handle)
+    if data is None:
+        data = render_jinja2(markdown_content, theme, embed_fonts, compact).encode("utf-8")
+        store.put(data, handle)
+    return data
+
+
+# 引用其他 Markdown 文件：单独一行的 <!-- include: 相对路径 -->
+INCLUDE_PATTERN = re.compile(r"^\s*<!--\s*include:\s*(.+?)\s*-->\s*$")
+
+
+class IncludeError(ValueError):
+    """include 指向的文件无法读取，或存在循环引用"""
+
+
+def split_front_matter(text: str):
+    """拆出文件开头的 front matter，返回 (front matter 原文, 正文)"""
+    stripped = text.strip()
+    if stripped.startswith("---"):
+        parts = stripped.split("---", 2)
+        if len(parts) >= 3:
+            return f"---{parts[1]}---\n", parts[2]
+    return "", text
+
+
+class SourceFile:
+    """解析后的 Markdown 源文件：正文段落和 include 按顺序排列"""
+
+    __slots__ = ("path", "mtime_ns", "size", "digest", "front_matter", "items")
+
+    def __init__(self, path, mtime_ns, size, text):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = content_hash(text)
+        self.front_matter, body = split_front_matter(text)
+        self.items = []  # ("text", 正文) 或 ("include", 绝对路径)
+        base_dir = os.path.dirname(path)
+        lines, in_code = [], False
+        for line in body.split("\n"):
+            if line.strip().startswith("```"):
+                in_code = not in_code
+            match = None if in_code else INCLUDE_PATTERN.match(line)
+            if match:
+                self.items.append(("text", "\n".join(lines)))
+                self.items.append(("include", os.path.normpath(os.path.join(base_dir, match.group(1)))))
+                lines = []
+            else:
+                lines.append(line)
+        self.items.append(("text", "\n".join(lines)))
+
+    @property
+    def includes(self):
+        return {value for kind, value in self.items if kind == "include"}
+
+
+class DeckBuild:
+    """一次构建的结果"""
+
+    __slots__ = ("path", "pages", "document", "sources", "files")
+
+    def __init__(self, path, pages, document, sources, files):
+        self.path = path
+        self.pages = pages
+        self.document = document  # 展开 include 后的完整 Markdown
+        self.sources = sources  # 每页来自哪个源文件
+        self.files = files  # 构建用到的全部源文件
+
+    @property
+    def title(self) -> str:
+        return extract_title(self.document) or "Untitled"
+
+
+class DeckBuilder:
+    """多文件演示文稿构建
+
+    入口文件通过 include 引用其他 Markdown 文件，include 处总是分页。
+    只有入口文件的 front matter 生效，被引用文件的 front matter 会被忽略。
+    各文件的正文按内容切成小段并缓存各段的拆分结果，文件修改后只有依赖它的演示文稿需要重建，
+    且只重新拆分变化的段，未变化的幻灯片片段直接命中片段缓存。
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._dependencies = {}  # 文件 -> 直接引用的文件
+        self._segments = LRUCache(max_entries=8192)
+        self._builds = {}
+        self._lock = threading.RLock()
+
+    def _load(self, path) -> SourceFile:
+        try:
+            stat = os.stat(path)
+            source = self._sources.get(path)
+            if source is not None and (source.mtime_ns, source.size) == (stat.st_mtime_ns, stat.st_size):
+                return source
+            with open(path, encoding="utf-8") as f:
+                source = SourceFile(path, stat.st_mtime_ns, stat.st_size, f.read())
+        except OSError as e:
+            raise IncludeError(f"无法读取 {path}: {e}") from e
+        self._sources[path] = source
+        self._dependencies[path] = source.includes
+        return source
+
+    def _expand(self, path, segments, files, stack):
+        if path in stack:
+            cycle = " -> ".join(stack[stack.index(path):] + [path])
+            raise IncludeError(f"循环引用: {cycle}")
+        source = self._load(path)
+        files.add(path)
+        for kind, value in source.items:
+            if kind == "include":
+                self._expand(value, segments, files, stack + [path])
+            elif value.strip():
+                segments.append((path, value))
+
+    def build(self, deck_path) -> DeckBuild:
+        """构建演示文稿，未变化的文件直接复用缓存的页面"""
+        path = os.path.abspath(deck_path)
+        with self._lock:
+            segments, files = [], set()
+            self._expand(path, segments, files, [])
+            front_matter = self._sources[path].front_matter
+            _, options = parse_frontmatter(front_matter)
+            document = front_matter + "\n\n---\n\n".join(text for _, text in segments)
+            header = segment_front_matter(front_matter)
+
+            # 没有 front matter 的文档以分页线开头时，moffee 会把它到下一条分页线之间当作 front matter，
+            # 可能跨越 include 的边界
+            unsplittable = not front_matter and document.lstrip().startswith("---")
+            if header is None or unsplittable or any(changes_heading_inheritance(text) for _, text in segments):
+                # 无法分段拆分时整体拆分
+                pages = compose_document(document)
+                sources = [path] * len(pages)
+            else:
+                pages, sources = self._compose_segments(header, self._group_segments(self._split_segments(segments)))
+                restore_heading_inheritance(pages, options)
+
+            build = DeckBuild(path, pages, document, sources, files)
+            self._builds[path] = build
+            return build
+
+    @staticmethod
+    def _split_segments(segments):
+        """把各文件的正文按内容切成小段，修改一张幻灯片只需重新拆分它所在的段"""
+        return [
+            (source, piece)
+            for source, text in segments
+            for piece in split_stable_segments(rm_comments(text))
+        ]
+
+    @staticmethod
+    def _group_segments(segments):
+        """按拆分单位分组：include 之后紧跟装饰行（@(...)）时与前一段一起拆分
+
+        与 split_document_segments 不在装饰行之前切分的原因相同：composite 对分页线后
+        紧跟装饰行的处理依赖前一段。返回 [[(源文件, 正文), ...], ...]。
+        """
+        groups = []
+        for source, text in segments:
+            first_line = next((line for line in text.split("\n") if line.strip() and not is_divider(line)), "")
+            if groups and contains_deco(first_line):
+                groups[-1].append((source, text))
+            else:
+                groups.append([(source, text)])
+        return groups
+
+    def _composite_cached(self, header, text):
+        key = content_hash(header, text)
+        pages = self._segments.get(key)
+        if pages is None:
+            pages = composite(header + text)
+            self._segments.put(key, pages)
+        return pages
+
+    def _compose_segments(self, header, groups):
+        texts = ["\n\n---\n\n".join(text for _, text in group) for group in groups]
+        keys = [content_hash(header, text) for text in texts]
+        composed = {key: self._segments.get(key) for key in keys}
+        missing = {key: text for key, text in zip(keys, texts) if composed[key] is None}
+        if missing:
+            documents = [header + text for text in missing.values()]
+            parallel = sum(map(len, documents)) >= PARALLEL_COMPOSE_MIN_CHARS and COMPOSE_WORKERS > 1
+            with profile_stage("composite"):
+                results = get_compose_pool().map(composite, documents) if parallel else map(composite, documents)
+                for key, segment_pages in zip(missing, results):
+                    composed[key] = segment_pages
+                    self._segments.put(key, segment_pages)
+
+        # 缓存中的页面保持不变，继承标题在副本上进行
+        pages, sources = [], []
+        for group, key in zip(groups, keys):
+            group_pages = composed[key]
+            owners = [group[-1][0]] * len(group_pages)
+            # 合并拆分的各部分按单独拆分时的页数确定每页来自哪个源文件
+            start = 0
+            for source, text in group[:-1]:
+                count = len(self._composite_cached(header, text))
+                for i in range(start, min(start + count, len(owners))):
+                    owners[i] = source
+                start += count
+            for page, source in zip(group_pages, owners):
+                page = copy.copy(page)
+                page.option = copy.copy(page.option)
+                pages.append(page)
+                sources.append(source)
+        return pages, sources
+
+    def changed_files(self):
+        """返回内容发生变化（或已删除）的源文件"""
+        changed = set()
+        with self._lock:
+            for path, source in list(self._sources.items()):
+                try:
+                    stat = os.stat(path)
+                    if (stat.st_mtime_ns, stat.st_size) == (source.mtime_ns, source.size):
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        unchanged = content_hash(f.read()) == source.digest
+                except OSError:
+                    unchanged = False
+                if unchanged:
+                    source.mtime_ns, source.size = stat.st_mtime_ns, stat.st_size
+                else:
+                    changed.add(path)
+                    del self._sources[path]
+        return changed
+
+    def dependents(self, paths):
+        """沿 include 依赖图反向查找，返回直接或间接引用了 paths 的所有文件（含自身）"""
+        reverse = {}
+        for path, includes in self._dependencies.items():
+            for included in includes:
+                reverse.setdefault(included, set()).add(path)
+        result, pending = set(paths), list(paths)
+        while pending:
+            for parent in reverse.get(pending.pop(), ()):
+                if parent not in result:
+                    result.add(parent)
+                    pending.append(parent)
+        return result
+
+    def affected_decks(self, changed):
+        """已构建过的演示文稿中，受 changed 中文件影响的入口文件"""
+        affected = self.dependents(changed)
+        return [path for path in self._builds if path in affected]
+
+    def rebuild_changed(self):
+        """重新构建受文件修改影响的演示文稿，返回 {入口文件: DeckBuild}"""
+        with self._lock:
+            changed = self.changed_files()
+            return {path: self.build(path) for path in self.affected_decks(changed)}
+
+
+@shared_resource
+def get_deck_builder():
+    """进程内共享的多文件构建器"""
+    return DeckBuilder()
+
+
+def render_deck_file(path: str, theme: str = "default", builder: DeckBuilder = None,
+                     embed_fonts: bool = False, compact: bool = False) -> str:
+    """构建多文件演示文稿并渲染为 HTML"""
+    build = (builder or get_deck_builder()).build(path)
+    return render_pages(build.pages, theme, build.title, embed_fonts, compact, index=True, source=build.path)
+
+
+# 全文检索：西文按单词切分，中日韩文字按单字和相邻两字切分
+_SEARCH_TOKEN = re.compile(r"[0-9a-z]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+SEARCH_HEADING_WEIGHT = 3.0
+# 正文中的 HTML 标签不参与检索，也不出现在摘要中
+_HTML_TAG = re.compile(r"<!--.*?-->|</?[a-zA-Z][^>]*>", re.S)
+
+
+def normalize_search_text(text: str) -> str:
+    """统一全角/半角和大小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def search_tokens(text: str, query: bool = False):
+    """切分检索词
+
+    建索引时中日韩文字同时产生单字和相邻两字，查询时多于一个字的片段只用相邻两字，
+    单独一个字用单字，这样任意长度的中文查询都能命中。
+    """
+    tokens = []
+    for match in _SEARCH_TOKEN.finditer(normalize_search_text(text)):
+        run = match.group()
+        if run.isascii():
+            tokens.append(run)
+            continue
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if query:
+            tokens.extend(bigrams or [run])
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+
+def slide_search_records(pages):
+    """提取每页的章节路径、标题和正文纯文本，返回 [(页码, 章节, 标题, 正文)]"""
+    records = []
+    for number, (page, meta) in enumerate(zip(pages, retrieve_structure(pages)["page_meta"]), start=1):
+        section = " / ".join(h for h in (meta.h1, meta.h2, meta.h3) if h)
+        heading = " / ".join(h for h in (page.h1, page.h2, page.h3) if h)
+        lines, stack = [], [page.chunk]
+        while stack:
+            chunk = stack.pop()
+            if chunk.type == "paragraph":
+                for line in _HTML_TAG.sub("", chunk.paragraph or "").split("\n"):
+                    line = line.strip()
+                    if line and not line.startswith("```"):
+                        line = html.unescape(_plain_text(re.sub(r"^([-*+]|\d+\.)\s+", "", line))).strip()
+                        if line:
+                            lines.append(line)
+            else:
+                stack.extend(reversed(chunk.children or []))
+        records.append((number, section, heading, "\n".join(lines)))
+    return records
+
+
+class SearchHit:
+    """一条检索结果：命中的演示文稿、幻灯片页码和所在章节"""
+
+    __slots__ = ("deck", "title", "source", "number", "section", "snippet", "score")
+
+    def __init__(self, deck, title, source, number, section, snippet, score):
+        self.deck = deck
+        self.title = title
+        self.source = source
+        self.number = number
+        self.section = section
+        self.snippet = snippet
+        self.score = score
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SearchIndex:
+    """保存在 SQLite 中的倒排索引，按演示文稿增量更新
 
-    return template.render(data)
+    每个检索词在每个演示文稿中占一行，命中的页码和权重打包为数组，
+    常见词在整个资料库中也只需读取与演示文稿数量相当的行。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS decks (
+        id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, title TEXT, source TEXT,
+        digest TEXT, slides INTEGER, indexed_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS slides (
+        deck INTEGER, number INTEGER, section TEXT, heading TEXT, body TEXT,
+        PRIMARY KEY (deck, number)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS postings (
+        term TEXT, deck INTEGER, hits INTEGER, numbers BLOB, weights BLOB,
+        PRIMARY KEY (term, deck)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS postings_deck ON postings (deck);
+    """
+
+    def __init__(self, path: str = None):
+        import sqlite3
+
+        self.path = path or SEARCH_INDEX_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+    def add_deck(self, key: str, title: str, pages, source: str = "") -> bool:
+        """建立或更新一个演示文稿的索引，内容未变化时返回 False"""
+        records = slide_search_records(pages)
+        digest = content_hash(title, records)
+        postings = {}
+        for number, section, heading, body in records:
+            for text, weight in ((section, SEARCH_HEADING_WEIGHT), (heading, SEARCH_HEADING_WEIGHT), (body, 1.0)):
+                for term in search_tokens(text):
+                    slides = postings.setdefault(term, {})
+                    slides[number] = slides.get(number, 0.0) + weight
+        with self._lock:
+            row = self._db.execute("SELECT id, digest FROM decks WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] == digest:
+                return False
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                if row is not None:
+                    self._delete(row[0])
+                deck_id = self._db.execute(
+                    "INSERT INTO decks (key, title, source, digest, slides, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, title, source, digest, len(records), time.time()),
+                ).lastrowid
+                self._db.executemany(
+                    "INSERT INTO slides VALUES (?, ?, ?, ?, ?)",
+                    ((deck_id, *record) for record in records),
+                )
+                self._db.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (term, deck_id, len(slides),
+                         np.fromiter(slides.keys(), dtype=np.int32, count=len(slides)).tobytes(),
+                         np.fromiter(slides.values(), dtype=np.float32, count=len(slides)).tobytes())
+                        for term, slides in postings.items()
+                    ),
+                )
+        return True
+
+    def remove_deck(self, key: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT id FROM decks WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._delete(row[0])
+        return True
+
+    def _delete(self, deck_id):
+        for table in ("postings", "slides"):
+            self._db.execute(f"DELETE FROM {table} WHERE deck = ?", (deck_id,))
+        self._db.execute("DELETE FROM decks WHERE id = ?", (deck_id,))
+
+    def _postings(self, term, decks=None):
+        """读取检索词的倒排表，返回按 (演示文稿, 页码) 排序的键数组和权重数组
+
+        decks 不为空时只读取这些演示文稿中的命中。
+        """
+        sql = "SELECT deck, hits, numbers, weights FROM postings WHERE term = ?"
+        if decks is None:
+            rows = self._db.execute(sql, (term,)).fetchall()
+        else:
+            rows = []
+            for i in range(0, len(decks), 500):
+                batch = decks[i:i + 500]
+                rows += self._db.execute(
+                    sql + " AND deck IN (" + ", ".join("?" * len(batch)) + ")", (term, *batch)
+                ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        deck_ids, hits, numbers, weights = zip(*rows)
+        keys = np.repeat(np.asarray(deck_ids, dtype=np.int64) << 32, hits)
+        keys |= np.frombuffer(b"".join(numbers), dtype=np.int32).astype(np.int64)
+        weights = np.frombuffer(b"".join(weights), dtype=np.float32).astype(np.float64)
+        order = np.argsort(keys, kind="stable")
+        return keys[order], weights[order]
+
+    def search(self, query: str, limit: int = 20):
+        """检索包含全部查询词的幻灯片，按 TF-IDF 排序"""
+        terms = list(dict.fromkeys(search_tokens(query, query=True)))
+        if not terms:
+            return []
+        # 中日韩文字按相邻两字匹配后，再确认原文中确实连续出现
+        phrases = [
+            run for run in _SEARCH_TOKEN.findall(normalize_search_text(query))
+            if not run.isascii() and len(run) > 2
+        ]
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(slides), 0) FROM decks").fetchone()[0]
+            document_frequency = {
+                term: self._db.execute(
+                    "SELECT COALESCE(SUM(hits), 0) FROM postings WHERE term = ?", (term,)
+                ).fetchone()[0]
+                for term in terms
+            }
+            keys = scores = None
+            # 从最少见的词开始求交集，之后只读取候选演示文稿中的命中
+            for term in sorted(terms, key=document_frequency.get):
+                if not document_frequency[term]:
+                    return []
+                decks = None if keys is None else np.unique(keys >> 32).tolist()
+                term_keys, weights = self._postings(term, decks)
+                term_scores = weights * math.log(1 + total / document_frequency[term])
+                if keys is None:
+                    keys, scores = term_keys, term_scores
+                else:
+                    keys, left, right = np.intersect1d(keys, term_keys, assume_unique=True, return_indices=True)
+                    scores = scores[left] + term_scores[right]
+                if len(keys) == 0:
+                    return []
+
+            hits = []
+            for i in np.argsort(-scores, kind="stable"):
+                deck_id, number = int(keys[i] >> 32), int(keys[i] & 0xFFFFFFFF)
+                key, title, source, section, heading, body = self._db.execute(
+                    "SELECT d.key, d.title, d.source, s.section, s.heading, s.body "
+                    "FROM slides s JOIN decks d ON d.id = s.deck WHERE s.deck = ? AND s.number = ?",
+                    (deck_id, number),
+                ).fetchone()
+                text = normalize_search_text("\n".join((section, heading, body)))
+                if not all(phrase in text for phrase in phrases):
+                    continue
+                hits.append(SearchHit(key, title, source, number, section,
+                                      search_snippet(body, query), float(scores[i])))
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    def stats(self):
+        with self._lock:
+            decks, slides = self._db.execute("SELECT COUNT(*), COALESCE(SUM(slides), 0) FROM decks").fetchone()
+            terms = self._db.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {"decks": decks, "slides": slides, "terms": terms}
+
+
+def search_snippet(body: str, query: str, width: int = 40) -> str:
+    """截取正文中第一个查询词附近的文字
+
+    在规范化后的文本中查找，规范化可能改变长度（如"㍿"），按逐字记录的原文位置换算回原文再截取。
+    """
+    normalized, offsets = [], []
+    for i, char in enumerate(body):
+        folded = normalize_search_text(char)
+        normalized.append(folded)
+        offsets.extend([i] * len(folded))
+    normalized = "".join(normalized)
+    positions = [
+        normalized.find(run) for run in _SEARCH_TOKEN.findall(normalize_search_text(query))
+    ]
+    positions = [offsets[p] for p in positions if p >= 0]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    snippet = body[start:start + width * 2].replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if start + width * 2 < len(body) else "")
+
+
+@shared_resource
+def get_search_index():
+    """进程内共享的检索索引"""
+    return SearchIndex()
 
 
-def generate_presentation_content(topic: str, num_slides: int = 5) -> str:
-    """根据主题生成演示文稿内容"""
-    # 这里可以集成 AI 模型来生成内容
-    # 目前使用示例内容
-    if "人工智能" in topic or "AI" in topic:
-        markdown_content = """# 人工智能发展趋势
+@shared_resource
+def get_index_executor():
+    """后台更新检索索引的单线程执行器，写入按提交顺序进行"""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="ppt-search-index")
+
+
+def deck_index_key(pages, title: str) -> str:
+    """按内容生成的检索索引键，内容不同的演示文稿各占一项；raw_md 不含标题，标题单独计入"""
+    return "deck:" + content_hash(title, [(page.h1, page.h2, page.h3, page.raw_md) for page in pages])[:32]
+
+
+def index_deck_async(pages, title: str, source: str = "", key: str = None):
+    """渲染后在后台更新检索索引；key 默认为 source，没有来源时按内容生成"""
+    key = key or source or deck_index_key(pages, title)
+    return get_index_executor().submit(get_search_index().add_deck, key, title, pages, source)
+
+
+# 示例内容生成后端使用的示例演示文稿，按主题关键词选择；默认示例中的 {topic} 替换为主题
+SAMPLE_PRESENTATIONS = [
+    (("人工智能", "AI"), """# 人工智能发展趋势
 
 ## 什么是人工智能
 
@@ -744,9 +3575,8 @@ def generate_presentation_content(topic: str, num_slides: int = 5) -> str:
 - AI伦理与责任归属
 - 就业结构变化与社会适应
 - 技术可控性与可解释性
-"""
-    elif "机器学习" in topic:
-        markdown_content = """# 机器学习基础入门
+"""),
+    (("机器学习",), """# 机器学习基础入门
 
 ## 机器学习概述
 
@@ -824,10 +3654,9 @@ def generate_presentation_content(topic: str, num_slides: int = 5) -> str:
 - 定期重新训练模型
 - 监控模型性能变化
 - 根据反馈调整模型参数
-"""
-    else:
-        # 默认示例内容
-        markdown_content = f"""# {topic}
+"""),
+]
+DEFAULT_SAMPLE_PRESENTATION = """# {topic}
 
 ## 简介
 
@@ -862,7 +3691,484 @@ def generate_presentation_content(topic: str, num_slides: int = 5) -> str:
 欢迎提问。
 """
 
-    return markdown_content
+
+class OutlineSection:
+    """大纲中的一节，展开后正好是一张幻灯片"""
+
+    __slots__ = ("heading", "subheading")
+
+    def __init__(self, heading: str, subheading: str = None):
+        self.heading = heading
+        self.subheading = subheading
+
+    def __eq__(self, other):
+        if not isinstance(other, OutlineSection):
+            return NotImplemented
+        return (self.heading, self.subheading) == (other.heading, other.subheading)
+
+    def __hash__(self):
+        return hash((self.heading, self.subheading))
+
+    def __repr__(self):
+        return f"OutlineSection({self.heading!r}, {self.subheading!r})"
+
+
+class ContentGenerationError(RuntimeError):
+    """某一节多次重试后仍然超时或失败"""
+
+
+class ContentBackend(abc.ABC):
+    """内容生成后端：先给出大纲，再逐节展开
+
+    expand 会在多个线程中同时调用，实现需要线程安全。
+    相同输入总是生成相同内容时把 deterministic 设为 True，渲染服务才会按主题缓存结果。
+    """
+
+    deterministic = False
+
+    @abc.abstractmethod
+    def outline(self, topic: str, num_slides: int):
+        """返回 (演示文稿标题, [OutlineSection, ...])，共 num_slides 节"""
+
+    @abc.abstractmethod
+    def expand(self, topic: str, title: str, section: OutlineSection) -> str:
+        """返回一节的正文 Markdown，不含该节的标题"""
+
+
+class StubContentBackend(ContentBackend):
+    """使用内置示例内容的确定性后端，不访问网络，供本地使用和测试
+
+    latency 为每次调用的模拟耗时（秒），用于观察并发展开的效果。
+    """
+
+    deterministic = True
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def _sample(topic: str):
+        """按幻灯片切分示例：返回 (标题, [(OutlineSection, 正文), ...])"""
+        for keywords, markdown_content in SAMPLE_PRESENTATIONS:
+            if any(keyword in topic for keyword in keywords):
+                break
+        else:
+            markdown_content = DEFAULT_SAMPLE_PRESENTATION.replace("{topic}", topic)
+        title, units = topic, []
+        heading, body = None, None
+        for line in markdown_content.split("\n"):
+            if line.startswith("# "):
+                title = line[2:].strip()
+            elif line.startswith("## "):
+                heading, body = line[3:].strip(), []
+                units.append([OutlineSection(heading), body])
+            elif line.startswith("### ") and heading is not None:
+                # 二级标题后紧跟的三级标题与它在同一页
+                if units[-1][0].subheading is None and not "".join(body).strip():
+                    units[-1][0] = OutlineSection(heading, line[4:].strip())
+                else:
+                    body = []
+                    units.append([OutlineSection(heading, line[4:].strip()), body])
+            elif body is not None and line.strip() != "---":
+                body.append(line)
+        return title, tuple((section, "\n".join(lines).strip()) for section, lines in units)
+
+    def outline(self, topic: str, num_slides: int):
+        if self.latency:
+            time.sleep(self.latency)
+        title, units = self._sample(topic)
+        sections = [section for section, _ in units[:num_slides]]
+        if len(sections) < num_slides:
+            # 示例不够时在最后一节之前补充
+            extra = [OutlineSection("补充内容", f"要点 {i + 1}") for i in range(num_slides - len(sections))]
+            sections = sections[:-1] + extra + sections[-1:]
+        return title, sections
+
+    def expand(self, topic: str, title: str, section: OutlineSection) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        for known, body in self._sample(topic)[1]:
+            if known == section:
+                return body
+        name = section.subheading or section.heading
+        return "\n".join(f"- {name}：关键点{i}" for i in range(1, 4))
+
+
+@shared_resource
+def get_content_backend() -> ContentBackend:
+    """按 PPT_CONTENT_BACKEND 创建内容生成后端
+
+    取值为 stub（默认）或 "模块:工厂函数"，工厂函数无参数，返回 ContentBackend。
+    """
+    if CONTENT_BACKEND in ("", "stub"):
+        return StubContentBackend()
+    module_name, _, factory_name = CONTENT_BACKEND.partition(":")
+    if not factory_name:
+        raise ValueError(f"PPT_CONTENT_BACKEND 应为 stub 或 模块:工厂函数，而不是 {CONTENT_BACKEND!r}")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+@shared_resource
+def get_generation_executor():
+    """逐节展开内容的线程池，所有会话共用"""
+    return ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="ppt-generate")
+
+
+def _section_body(text: str) -> str:
+    """清理后端返回的正文：标题改为粗体、去掉分页线，保证每节只占一张幻灯片"""
+    lines, fenced = [], False
+    for line in (text or "").strip().split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            fenced = not fenced
+        elif not fenced:
+            if re.match(r"#{1,6}\s", stripped):
+                line = "**" + stripped.lstrip("#").strip() + "**"
+            elif is_divider(stripped):
+                continue
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def expand_outline(backend: ContentBackend, topic: str, title: str, sections, timeout: float = None,
+                   retries: int = None, progress=None):
+    """在线程池中同时展开各节，按大纲顺序返回正文
+
+    每次尝试从开始执行时计时，在线程池中排队的时间不计入超时；超时或出错的节重新提交，
+    最多重试 retries 次。超时的尝试无法中断，会在后台运行完后丢弃结果；还在排队的尝试直接取消。
+    progress(已完成, 总数) 在每节完成时调用，抛出异常可中止生成。
+    """
+    timeout = SECTION_TIMEOUT if timeout is None else timeout
+    retries = SECTION_RETRIES if retries is None else retries
+    executor = get_generation_executor()
+    results = [None] * len(sections)
+    attempts = [0] * len(sections)
+    pending = {}  # future -> (节序号, [开始执行的时间])
+    # 等待开始执行的尝试时定期醒来，为刚开始执行的尝试计算截止时间
+    poll_interval = max(timeout / 10, 0.01)
+
+    def run_attempt(section, started):
+        started[0] = time.monotonic()
+        return backend.expand(topic, title, section)
+
+    def submit(index):
+        attempts[index] += 1
+        started = [None]
+        future = executor.submit(run_attempt, sections[index], started)
+        pending[future] = (index, started)
+
+    def retry(index, error):
+        if attempts[index] > retries:
+            raise ContentGenerationError(
+                f"第 {index + 1} 节“{sections[index].subheading or sections[index].heading}”"
+                f"尝试 {attempts[index]} 次后仍失败: {error!r}"
+            ) from error
+        submit(index)
+
+    try:
+        for index in range(len(sections)):
+            submit(index)
+        completed = 0
+        while pending:
+            now = time.monotonic()
+            deadlines = [started[0] + timeout for _, started in pending.values() if started[0] is not None]
+            wake = min(deadlines) - now if deadlines else timeout
+            if len(deadlines) < len(pending):
+                wake = min(wake, poll_interval)
+            done, _ = wait(pending, timeout=max(wake, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                index, _ = pending.pop(future)
+                try:
+                    results[index] = _section_body(future.result())
+                except Exception as e:
+                    retry(index, e)
+                    continue
+                completed += 1
+                if progress is not None:
+                    progress(completed, len(sections))
+            now = time.monotonic()
+            for future, (index, started) in list(pending.items()):
+                if started[0] is not None and started[0] + timeout <= now:
+                    del pending[future]
+                    future.cancel()
+                    retry(index, TimeoutError(f"超过 {timeout:g} 秒"))
+    finally:
+        for future in pending:
+            future.cancel()
+    return results
+
+
+@profiled("generate_presentation_content")
+def generate_presentation_content(topic: str, num_slides: int = 5, backend: ContentBackend = None,
+                                  progress=None) -> str:
+    """根据主题生成演示文稿内容：先生成 num_slides 节的大纲，再并发展开各节并按顺序拼接"""
+    backend = backend or get_content_backend()
+    num_slides = max(int(num_slides), 1)
+    with profile_stage("outline"):
+        title, sections = backend.outline(topic, num_slides)
+    sections = list(sections)[:num_slides]
+    with profile_stage("expand"):
+        bodies = expand_outline(backend, topic, title, sections, progress=progress)
+
+    # 与上一节二级标题相同时不再重复，三级标题沿用它
+    parts, heading = [], None
+    for section, body in zip(sections, bodies):
+        lines = [f"# {title}"] if not parts else []
+        if section.heading != heading or not section.subheading:
+            lines.append(f"## {section.heading}")
+            heading = section.heading
+        if section.subheading:
+            lines.append(f"### {section.subheading}")
+        parts.append("\n\n".join(lines + ([body] if body else [])))
+    return "\n\n---\n\n".join(parts) + "\n"
+
+
+class JobCancelled(Exception):
+    """任务已被取消或被新的任务取代"""
+
+
+class JobQueueFull(Exception):
+    """等待中的任务过多"""
+
+
+class RenderJob:
+    """后台任务：记录状态和进度，支持协作式取消"""
+
+    ACTIVE_STATUSES = ("pending", "running")
+
+    def __init__(self, owner=None):
+        self.job_id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = "pending"
+        self.progress = 0.0
+        self.message = "等待中..."
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self._cancel_event = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def checkpoint(self):
+        """取消检查点：任务已取消时抛出 JobCancelled"""
+        if self.cancelled:
+            raise JobCancelled(self.job_id)
+
+    def report(self, progress: float, message: str = None):
+        """更新进度，同时作为取消检查点"""
+        self.checkpoint()
+        self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+
+class RenderJobManager:
+    """有界线程池上的后台任务管理器，同一用户重新提交时取消旧任务"""
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, max_finished=256):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ppt-job")
+        self._jobs = OrderedDict()
+        self._latest_by_owner = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner, fn, *args, **kwargs) -> RenderJob:
+        """提交任务，fn 的第一个参数为 RenderJob，用于汇报进度"""
+        job = RenderJob(owner)
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status == "pending")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"等待中的任务已达上限 {self.max_pending}")
+            previous = self._jobs.get(self._latest_by_owner.get(owner))
+            if previous is not None and previous.active:
+                previous.cancel()
+            self._jobs[job.job_id] = job
+            if owner is not None:
+                self._latest_by_owner[owner] = job.job_id
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.progress = 1.0
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+
+@shared_resource
+def get_job_manager():
+    """进程内共享的后台任务管理器"""
+    return RenderJobManager()
+
+
+def build_deck_job(job: RenderJob, topic: str, num_slides: int, theme: str, profile: bool = False) -> dict:
+    """后台生成演示文稿内容并预先渲染幻灯片片段"""
+    if profile:
+        # 剖析结果按任务保存在缓存目录中，页面上提供下载
+        profiler = RenderProfiler(os.path.join(CACHE_DIR, "profiles", job.job_id, "deck"))
+        with profiler:
+            result = build_deck_job(job, topic, num_slides, theme)
+        result["profile"] = profiler.files
+        return result
+
+    job.report(0.05, "正在生成内容...")
+    markdown_content = generate_presentation_content(
+        topic, num_slides,
+        progress=lambda done, total: job.report(0.05 + 0.25 * done / total, f"正在生成内容 {done}/{total}..."),
+    )
+
+    job.report(0.3, "正在拆分页面...")
+    pages = compose_document(markdown_content)
+    job.checkpoint()
+
+    cache = get_fragment_cache()
+    for start in range(0, len(pages), PREVIEW_PAGE_SIZE):
+        job.report(0.3 + 0.7 * start / max(len(pages), 1), f"正在渲染幻灯片 {start + 1}/{len(pages)}...")
+        render_slide_fragments(pages, theme, start, start + PREVIEW_PAGE_SIZE, cache, checkpoint=job.checkpoint)
+    # 同一主题重新生成的内容各自建索引，下载时渲染同一内容也落在同一项上
+    title = extract_title(markdown_content) or topic
+    index_deck_async(pages, title, f"生成: {topic}", deck_index_key(pages, title))
+
+    return {"markdown": markdown_content, "theme": theme, "slides": len(pages)}
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_deck_job_progress():
+    """任务进行中只定时刷新进度这一块，页面其余部分（包括上一份预览）保持不变；
+    任务结束后重新运行整个页面，显示新的结果"""
+    job_id = st.session_state.get("deck_job")
+    job = get_job_manager().get(job_id) if job_id is not None else None
+    if job is None or not job.active:
+        st.rerun()
+    st.progress(job.progress, text=job.message)
+    if st.button("取消生成"):
+        job.cancel()
+        st.caption("正在取消...")
+
+
+def poll_deck_job():
+    """查询当前会话的后台任务：未结束时显示进度，结束时保存结果"""
+    job_id = st.session_state.get("deck_job")
+    if job_id is None:
+        return
+    job = get_job_manager().get(job_id)
+    if job is None:
+        st.session_state.pop("deck_job", None)
+        return
+
+    if job.active:
+        show_deck_job_progress()
+        return
+
+    st.session_state.pop("deck_job", None)
+    if job.status == "done":
+        # 保存结果，翻页等操作触发重新运行时仍可预览
+        st.session_state["deck_markdown"] = job.result["markdown"]
+        st.session_state["deck_theme"] = job.result["theme"]
+        st.session_state["preview_page"] = 1
+        st.session_state.pop("deck_handle", None)
+        st.session_state["deck_profile"] = job.result.get("profile")
+        
+        # 显示结果
+        st.success("演示文稿生成成功！")
+    elif job.status == "failed":
+        st.error(f"生成失败：{job.error}")
+    else:
+        st.info("已取消生成")
+
+
+def show_deck_preview(markdown_content: str, theme: str):
+    """分页预览演示文稿，只向浏览器发送当前页的幻灯片"""
+    import streamlit.components.v1 as components
+    
+    pages = compose_document(markdown_content)
+    total = len(pages)
+    page_count = max(1, math.ceil(total / PREVIEW_PAGE_SIZE))
+    
+    if page_count > 1:
+        preview_page = st.number_input(
+            "预览页码", min_value=1, max_value=page_count, key="preview_page"
+        )
+    else:
+        preview_page = 1
+    preview_page = min(int(preview_page), page_count)
+    start = (preview_page - 1) * PREVIEW_PAGE_SIZE
+    stop = min(start + PREVIEW_PAGE_SIZE, total)
+    
+    # 使用组件显示当前页的幻灯片
+    components.html(render_slide_range(markdown_content, theme, start, stop), height=700, scrolling=True)
+    st.caption(f"第 {start + 1}-{stop} 张，共 {total} 张")
+    
+    # 预取前后相邻页，翻页时直接命中缓存
+    prefetch_slide_fragments(pages, theme, stop, stop + PREVIEW_PAGE_SIZE)
+    prefetch_slide_fragments(pages, theme, start - PREVIEW_PAGE_SIZE, start)
+    
+    # 完整的 HTML 只在需要下载时拼装，存放在磁盘上，会话中只保存句柄
+    embed_fonts = st.checkbox(
+        "内嵌字体（只包含用到的字符，在其他电脑上显示一致）",
+        key="embed_fonts",
+        disabled=font_subset is None,
+        help=None if font_subset is not None else "需要安装 fontTools",
+    )
+    compact = st.checkbox(
+        "紧凑格式（幻灯片在浏览器中按需渲染，文件更小）",
+        key="compact_html",
+    )
+    handle = deck_handle(markdown_content, theme, embed_fonts, compact)
+    if st.session_state.get("deck_handle") != handle:
+        if st.button("准备下载HTML文件"):
+            with st.spinner("正在生成HTML文件..."):
+                st.session_state["deck_handle"] = get_deck_store().put(
+                    render_jinja2(markdown_content, theme, embed_fonts, compact), handle
+                )
+            st.rerun()
+    else:
+        # 点击下载时才读取内容
+        st.download_button(
+            label="下载HTML文件",
+            data=functools.partial(load_deck_html, markdown_content, theme, embed_fonts, compact),
+            file_name="presentation.html",
+            mime="text/html"
+        )
+    
+    # 提供PDF转换提示
+    st.info("提示：在演示文稿页面中，您可以点击右下角的“Save as PDF”按钮将演示文稿保存为PDF文件。")
 
 
 def main():
@@ -875,7 +4181,7 @@ def main():
     st.title("AI PPT Generator 📊")
     
     # 创建标签页
-    tab1, tab2 = st.tabs(["演示文稿生成", "模板编辑器"])
+    tab1, tab2, tab3 = st.tabs(["演示文稿生成", "模板编辑器", "幻灯片检索"])
     
     with tab1:
         st.markdown("将自然语言转换为专业的演示文稿")
@@ -905,32 +4211,28 @@ def main():
         # 生成按钮
         if st.button("生成演示文稿", type="primary"):
             if user_input:
-                with st.spinner("正在生成演示文稿..."):
-                    # 生成内容
-                    markdown_content = generate_presentation_content(user_input, num_slides)
-                    
-                    # 渲染为HTML，使用选定的主题
-                    html_content = render_jinja2(markdown_content, selected_theme_key)
-                    
-                    # 显示结果
-                    st.success("演示文稿生成成功！")
-                    
-                    # 使用组件显示HTML
-                    import streamlit.components.v1 as components
-                    components.html(html_content, height=700, scrolling=True)
-                    
-                    # 提供下载选项
-                    st.download_button(
-                        label="下载HTML文件",
-                        data=html_content,
-                        file_name="presentation.html",
-                        mime="text/html"
+                # 在后台生成，重复提交时取代尚未完成的旧任务
+                session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+                # 隐藏的剖析开关：允许时页面地址加 ?profile=1
+                profile = profiling_requested() or (
+                    profile_query_param_allowed() and st.query_params.get("profile") == "1"
+                )
+                try:
+                    job = get_job_manager().submit(
+                        session_id, build_deck_job, user_input, num_slides, selected_theme_key, profile
                     )
-                    
-                    # 提供PDF转换提示
-                    st.info("提示：在演示文稿页面中，您可以点击右下角的“Save as PDF”按钮将演示文稿保存为PDF文件。")
+                    st.session_state["deck_job"] = job.job_id
+                except JobQueueFull:
+                    st.warning("当前生成任务较多，请稍后再试")
             else:
                 st.warning("请输入演示文稿主题和内容要求")
+        
+        poll_deck_job()
+        
+        if "deck_markdown" in st.session_state:
+            show_deck_preview(st.session_state["deck_markdown"], st.session_state["deck_theme"])
+        if st.session_state.get("deck_profile"):
+            show_profile_downloads(st.session_state["deck_profile"])
     
     with tab2:
         st.header("模板编辑器")
@@ -1072,6 +4374,448 @@ h3 {{
             st.info("自定义CSS功能将在渲染时应用到演示文稿中")
             st.code(custom_css, language="css")
 
+    with tab3:
+        show_search_tab()
+
+
+def show_profile_downloads(files):
+    """提供本次生成的性能剖析结果下载"""
+    with st.expander("性能剖析结果"):
+        for path in files:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if path.endswith(".allocations.txt"):
+                st.code(data.decode("utf-8"), language=None)
+            st.download_button(
+                label=f"下载 {os.path.basename(path)}",
+                data=data,
+                file_name=os.path.basename(path),
+                key=f"profile-{path}",
+            )
+
+
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]()#+\-.!|~>$:])")
+
+
+def escape_markdown(text: str) -> str:
+    """把检索结果里的幻灯片原文转成纯文本 Markdown：先转义 HTML，再给 Markdown 标点加反斜杠"""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", html.escape(text, quote=False))
+
+
+def show_search_tab():
+    """在已渲染过的全部演示文稿中检索幻灯片"""
+    st.header("幻灯片检索")
+    index = get_search_index()
+    stats = index.stats()
+    st.caption(f"已索引 {stats['decks']} 个演示文稿，共 {stats['slides']} 张幻灯片")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("关键词", placeholder="例如：机器学习 应用", key="search_query")
+    with col2:
+        limit = st.number_input("最多显示", min_value=5, max_value=200, value=20, key="search_limit")
+    if not query.strip():
+        return
+
+    started = time.perf_counter()
+    hits = index.search(query, int(limit))
+    elapsed = (time.perf_counter() - started) * 1000
+    st.caption(f"找到 {len(hits)} 条结果，用时 {elapsed:.1f} ms")
+    # 同一个演示文稿的结果放在一起，按最高得分排序
+    decks = OrderedDict()
+    for hit in hits:
+        decks.setdefault(hit.deck, []).append(hit)
+    for deck_hits in decks.values():
+        first = deck_hits[0]
+        # 标题、章节和摘要都来自幻灯片原文，转义后再交给 st.markdown，避免其中的 Markdown/HTML 被渲染
+        st.markdown(f"**{escape_markdown(first.title)}**"
+                    + (f"  ·  {escape_markdown(first.source)}" if first.source else ""))
+        for hit in deck_hits:
+            st.markdown(f"- 第 {hit.number} 张" + (f" · {escape_markdown(hit.section)}" if hit.section else "")
+                        + (f"：{escape_markdown(hit.snippet)}" if hit.snippet else ""))
+
+
+def load_theme_file(path: str) -> str:
+    """载入模板编辑器导出的主题配置 JSON，注册到 THEMES 并返回主题标识符"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict) or not config:
+        raise ValueError(f"{path} 不是有效的主题配置")
+    for key, theme in config.items():
+        if not all(isinstance(theme.get(field), dict) for field in ("colors", "fonts")):
+            raise ValueError(f"{path} 中的主题 {key!r} 缺少 colors 或 fonts")
+        THEMES[key] = {
+            "name": theme.get("name", key),
+            "colors": dict(THEMES["default"]["colors"], **theme["colors"]),
+            "fonts": dict(THEMES["default"]["fonts"], **theme["fonts"]),
+        }
+    return next(iter(config))
+
+
+class PollingWatcher:
+    """定时比较文件的修改时间和大小"""
+
+    def __init__(self, paths, interval=0.05):
+        self.interval = interval
+        self._stats = {}
+        self.update(paths)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def update(self, paths):
+        self._stats = {
+            path: self._stats.get(path) or self._stat(path) for path in map(os.path.abspath, paths)
+        }
+
+    def wait(self, timeout):
+        """等待文件变化，返回变化的文件集合；超时返回空集合"""
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, previous in self._stats.items():
+                current = self._stat(path)
+                if current != previous:
+                    self._stats[path] = current
+                    changed.add(path)
+            if changed or time.monotonic() >= deadline:
+                return changed
+            time.sleep(min(self.interval, max(deadline - time.monotonic(), 0)))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """基于 Linux inotify 的文件监视，监视文件所在目录以兼容编辑器的原子替换保存"""
+
+    _MASK = 0x2 | 0x8 | 0x80 | 0x100 | 0x200  # MODIFY | CLOSE_WRITE | MOVED_TO | CREATE | DELETE
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, paths):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._get_errno = ctypes.get_errno
+        self._directories = {}  # watch descriptor -> 目录
+        self.paths = set()
+        self.update(paths)
+
+    def update(self, paths):
+        self.paths = set(map(os.path.abspath, paths))
+        watched = set(self._directories.values())
+        for directory in {os.path.dirname(path) for path in self.paths} - watched:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self._MASK)
+            if wd < 0:
+                raise OSError(self._get_errno(), f"无法监视 {directory}")
+            self._directories[wd] = directory
+
+    def wait(self, timeout):
+        """等待文件变化，返回变化的文件集合；超时返回空集合"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + self._EVENT.size <= len(data):
+                wd, _, _, name_length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                path = os.path.join(self._directories.get(wd, ""), os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_file_watcher(paths, polling=False):
+    """优先使用 inotify，不可用时（非 Linux 等）退回定时轮询"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths)
+
+
+# 注入到预览页面中的自动刷新脚本，刷新后恢复滚动位置
+LIVE_RELOAD_SCRIPT = """
+<script>
+(function() {
+    const key = 'ppt-live-reload-scroll';
+    const saved = sessionStorage.getItem(key);
+    if (saved !== null) {
+        sessionStorage.removeItem(key);
+        window.addEventListener('load', function() { window.scrollTo(0, Number(saved)); });
+    }
+    new EventSource('/__livereload').onmessage = function() {
+        sessionStorage.setItem(key, String(window.scrollY));
+        location.reload();
+    };
+})();
+</script>
+"""
+
+
+class LiveReloadServer:
+    """在本地提供预览页面，内容更新后通过 Server-Sent Events 通知浏览器刷新"""
+
+    def __init__(self, host="127.0.0.1", port=8000):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self._html = b""
+        self._version = 0
+        self._changed = threading.Condition()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/__livereload":
+                    server._stream_events(self)
+                elif self.path in ("/", "/index.html"):
+                    body = server._html
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("Cache-Control", "no-store")
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_error(404)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/"
+
+    def publish(self, html_content: str):
+        """更新页面内容并通知所有已打开的页面刷新"""
+        if "</body>" in html_content:
+            head, tail = html_content.rsplit("</body>", 1)
+            html_content = head + LIVE_RELOAD_SCRIPT + "</body>" + tail
+        else:
+            html_content += LIVE_RELOAD_SCRIPT
+        with self._changed:
+            self._html = html_content.encode("utf-8")
+            self._version += 1
+            self._changed.notify_all()
+
+    def _stream_events(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-store")
+        handler.end_headers()
+        with self._changed:
+            version = self._version
+        try:
+            while True:
+                with self._changed:
+                    self._changed.wait_for(lambda: self._version != version, timeout=15)
+                    updated = self._version != version
+                    version = self._version
+                # 无更新时发送注释行保持连接
+                handler.wfile.write(b"data: reload\n\n" if updated else b": ping\n\n")
+                handler.wfile.flush()
+        except OSError:
+            pass
+
+    def serve_in_background(self):
+        threading.Thread(target=self.httpd.serve_forever, name="ppt-live-reload", daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def watch_deck(deck_path: str, theme: str = "default", theme_file: str = None,
+               host: str = "127.0.0.1", port: int = 8000, polling: bool = False, debounce: float = 0.01):
+    """监视演示文稿及其 include 的文件和主题文件，修改后增量重建并刷新浏览器"""
+    builder = DeckBuilder()
+    if theme_file:
+        theme_file = os.path.abspath(theme_file)
+        theme = load_theme_file(theme_file)
+    build = builder.build(deck_path)
+    server = LiveReloadServer(host, port)
+    server.publish(render_pages(build.pages, theme, build.title, index=True, source=build.path))
+    server.serve_in_background()
+    print(f"预览地址: {server.url}  (Ctrl+C 退出)")
+
+    def watched_files():
+        return build.files | ({theme_file} if theme_file else set())
+
+    watcher = create_file_watcher(watched_files(), polling)
+    try:
+        while True:
+            changed = watcher.wait(1.0)
+            if not changed:
+                continue
+            # 编辑器保存时往往连续产生多个事件，稍等片刻合并处理
+            changed |= watcher.wait(debounce)
+            started = time.perf_counter()
+            try:
+                if theme_file in changed:
+                    theme = load_theme_file(theme_file)
+                rebuilt = builder.rebuild_changed()
+                build = rebuilt.get(build.path, build)
+                server.publish(render_pages(build.pages, theme, build.title, index=True, source=build.path))
+            except (IncludeError, ValueError, OSError) as e:
+                print(f"构建失败: {e}")
+                continue
+            finally:
+                watcher.update(watched_files())
+            elapsed = (time.perf_counter() - started) * 1000
+            names = ", ".join(sorted(os.path.basename(path) for path in changed))
+            print(f"{names} 已更新，{len(build.pages)} 张幻灯片，重建耗时 {elapsed:.0f} ms")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        server.close()
+
+
+def cli(argv=None):
+    """命令行入口：python moffee_tool_v1.py <命令> ..."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="AI PPT Generator 命令行工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="构建（可包含 include 的）Markdown 演示文稿")
+    build_parser.add_argument("deck", help="入口 Markdown 文件")
+    build_parser.add_argument("-o", "--output", help="输出 HTML 路径，默认与入口文件同名")
+    build_parser.add_argument("--theme", default="default", choices=list(THEMES))
+    build_parser.add_argument("--split", action="store_true",
+                              help="拆分导出到目录：入口页面 + 每张幻灯片一个文件，按需加载")
+    build_parser.add_argument("--keep-stale", action="store_true", help="拆分导出时保留不再引用的旧文件")
+    build_parser.add_argument("--compact", action="store_true",
+                              help="输出紧凑格式：幻灯片以 JSON 模型内嵌，在浏览器中按需渲染")
+    build_parser.add_argument("--embed-fonts", action="store_true",
+                              help="内嵌主题字体中用到的字符（需要 fontTools）")
+    build_parser.add_argument("--profile", action="store_true",
+                              help="剖析本次构建，结果保存在输出文件旁（也可设置 PPT_PROFILE=1）")
+
+    watch_parser = commands.add_parser("watch", help="监视文件修改，增量重建并自动刷新浏览器")
+    watch_parser.add_argument("deck", help="入口 Markdown 文件")
+    watch_parser.add_argument("--theme", default="default", choices=list(THEMES))
+    watch_parser.add_argument("--theme-file", help="模板编辑器导出的主题配置 JSON，修改后同样自动刷新")
+    watch_parser.add_argument("--host", default="127.0.0.1")
+    watch_parser.add_argument("--port", type=int, default=8000)
+    watch_parser.add_argument("--poll", action="store_true", help="不使用 inotify，改为定时轮询")
+
+    search_parser = commands.add_parser("search", help="在已索引的演示文稿中检索幻灯片")
+    search_parser.add_argument("query", help="检索词，多个词之间为“且”的关系")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+
+    bundle_parser = commands.add_parser("bundle", help="把多个演示文稿打包为一个 ZIP，共用的资源只存一份")
+    bundle_parser.add_argument("decks", nargs="+", help="入口 Markdown 文件")
+    bundle_parser.add_argument("-o", "--output", default="decks.zip", help="输出 ZIP 路径")
+    bundle_parser.add_argument("--theme", default="default", choices=list(THEMES))
+    bundle_parser.add_argument("--embed-fonts", action="store_true",
+                               help="内嵌全部演示文稿用到的字符（需要 fontTools）")
+    bundle_parser.add_argument("--compact", action="store_true", help="演示文稿使用紧凑格式")
+
+    index_parser = commands.add_parser("index", help="把已有的 Markdown 演示文稿加入检索索引")
+    index_parser.add_argument("decks", nargs="+", help="入口 Markdown 文件")
+
+    args = parser.parse_args(argv)
+    if args.command == "build" and args.split and args.compact:
+        parser.error("--compact 不能与 --split 同时使用")
+    if args.command == "search":
+        started = time.perf_counter()
+        hits = get_search_index().search(args.query, args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        if args.json:
+            print(json.dumps([hit.to_dict() for hit in hits], ensure_ascii=False, indent=2))
+            return
+        for hit in hits:
+            print(f"{hit.title} [{hit.source}] 第 {hit.number} 张 · {hit.section}\n    {hit.snippet}")
+        print(f"共 {len(hits)} 条结果，用时 {elapsed:.1f} ms")
+    elif args.command == "index":
+        index, builder = get_search_index(), get_deck_builder()
+        for deck in args.decks:
+            build = builder.build(deck)
+            updated = index.add_deck(build.path, build.title, build.pages, build.path)
+            print(f"{deck}: {len(build.pages)} 张幻灯片，{'已更新' if updated else '无变化'}")
+    elif args.command == "bundle":
+        if args.embed_fonts and font_subset is None:
+            print("未安装 fontTools，不内嵌字体", file=sys.stderr)
+            args.embed_fonts = False
+        stats = export_bundle(args.decks, args.output, args.theme, args.embed_fonts, args.compact)
+        mb = 1024 * 1024
+        print(f"已生成 {stats['path']}：{stats['decks']} 个演示文稿，{stats['slides']} 张幻灯片，"
+              f"共用资源 {stats['assets']} 个（被引用 {stats['asset_refs']} 次）")
+        print(f"单独导出共 {stats['separate_bytes'] / mb:.2f} MB，打包后 {stats['bundle_bytes'] / mb:.2f} MB，"
+              f"节省 {stats['saved_bytes'] / mb:.2f} MB；压缩包 {stats['archive_bytes'] / mb:.2f} MB")
+    elif args.command == "watch":
+        watch_deck(args.deck, args.theme, args.theme_file, args.host, args.port, args.poll)
+    elif args.command == "build":
+        if args.split:
+            output = args.output or os.path.splitext(args.deck)[0] + "_site"
+            profile_prefix = os.path.join(output, "profile")
+        else:
+            output = args.output or os.path.splitext(args.deck)[0] + ".html"
+            profile_prefix = os.path.splitext(output)[0] + ".profile"
+        if args.profile or profiling_requested():
+            profiler = RenderProfiler(profile_prefix)
+            with profiler:
+                build_deck_output(args, output)
+            print("剖析结果: " + ", ".join(profiler.files))
+        else:
+            build_deck_output(args, output)
+
+
+def build_deck_output(args, output):
+    """执行 build 命令：输出单个 HTML 文件或拆分导出到目录"""
+    if args.embed_fonts and font_subset is None:
+        print("未安装 fontTools，不内嵌字体", file=sys.stderr)
+        args.embed_fonts = False
+    build = get_deck_builder().build(args.deck)
+    if not args.split:
+        html_content = render_deck_file(args.deck, args.theme, embed_fonts=args.embed_fonts, compact=args.compact)
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(html_content)
+        print(f"已生成 {output}")
+    else:
+        index_deck_async(build.pages, build.title, build.path)
+        stats = export_split_deck(build.pages, output, args.theme, build.title, prune=not args.keep_stale,
+                                  embed_fonts=args.embed_fonts)
+        print(f"已生成 {stats['index']}：{stats['slides']} 张幻灯片，写入 {stats['written']} 个文件，"
+              f"复用 {stats['reused']} 个，清理 {stats['removed']} 个")
+    if args.embed_fonts:
+        # 子集字体已缓存，这里只是汇总结果
+        _, report = embedded_font_css(args.theme, render_slide_fragments(build.pages, args.theme))
+        for family, size in report["fonts"].items():
+            print(f"内嵌字体 {family}: {size / 1024:.1f} KB")
+        if report["missing"]:
+            print(f"本机字体中找不到 {len(report['missing'])} 个字符: {report['missing'][:40]}", file=sys.stderr)
+
 
 if __name__ == "__main__":
-    main()
+    # 通过 streamlit run 启动时没有命令行参数
+    if len(sys.argv) > 1:
+        cli()
+    else:
+        main()
@@ -0,0 +1,313 @@
+"""演示文稿渲染 HTTP 服务
+
+不经过 Streamlit 界面，直接调用 render_jinja2 / generate_presentation_content 生成 HTML。
+
+    python render_service.py --port 8765 --workers 4
+
+接口：
+    POST /render   JSON: {"markdown": "...", "theme": "dark"}
+                   或    {"topic": "人工智能", "num_slides": 5, "theme": "ocean"}
+    GET  /themes   可用主题列表
+    GET  /healthz  服务状态
+
+渲染在进程池中执行；等待队列满时返回 429。响应带有 ETag（包含渲染器版本，升级后自动失效），
+携带 If-None-Match 的重复请求直接返回 304，不再渲染。按主题生成时，
+只有内容生成后端是确定性的才使用 ETag 和结果缓存。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from moffee_tool_v1 import (
+    THEMES,
+    LRUCache,
+    content_hash,
+    generate_presentation_content,
+    get_content_backend,
+    render_jinja2,
+    renderer_version,
+)
+
+logger = logging.getLogger("render_service")
+
+MAX_BODY_BYTES = 5 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+RESULT_CACHE_ENTRIES = 256
+MAX_CACHED_RESULT_BYTES = 4 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message)
+        self.status = status
+        self.message = message or REASONS.get(status, "")
+
+
+def _render_in_worker(markdown, topic, num_slides, theme):
+    """在进程池中执行：按需生成内容并渲染为 HTML"""
+    if markdown is None:
+        markdown = generate_presentation_content(topic, num_slides)
+    return render_jinja2(markdown, theme).encode("utf-8")
+
+
+def _warm_up():
+    """预热工作进程：完成模块导入并编译模板"""
+    render_jinja2("# warm up")
+    return os.getpid()
+
+
+def parse_render_request(body: bytes):
+    """校验请求体，返回 (markdown, topic, num_slides, theme)"""
+    try:
+        payload = json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise HTTPError(400, "请求体必须是 JSON")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "请求体必须是 JSON 对象")
+
+    markdown = payload.get("markdown")
+    topic = payload.get("topic")
+    theme = payload.get("theme", "default")
+    num_slides = payload.get("num_slides", 5)
+    if (markdown is None) == (topic is None):
+        raise HTTPError(400, "markdown 和 topic 必须且只能提供一个")
+    if not isinstance(markdown or topic, str) or not (markdown or topic).strip():
+        raise HTTPError(400, "markdown/topic 必须是非空字符串")
+    if not isinstance(theme, str):
+        raise HTTPError(400, "theme 必须是字符串")
+    if not isinstance(num_slides, int) or isinstance(num_slides, bool) or not 1 <= num_slides <= 100:
+        raise HTTPError(400, "num_slides 必须是 1-100 的整数")
+    return markdown, topic, num_slides, theme
+
+
+class RenderService:
+    """asyncio 前端 + 进程池渲染，带有界队列和 ETag 缓存"""
+
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or os.cpu_count() or 2
+        self.queue_size = queue_size or self.workers * 4
+        self.queue = None
+        self.pool = None
+        self._dispatchers = []
+        self._inflight = {}  # 相同 ETag 的并发请求共享一次渲染
+        self._results = LRUCache(max_entries=RESULT_CACHE_ENTRIES)
+        self.stats = {"rendered": 0, "cache_hits": 0, "not_modified": 0, "rejected": 0}
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.pool, _warm_up) for _ in range(self.workers)
+        ))
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch()) for _ in range(self.workers)
+        ]
+
+    async def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            args, future = await self.queue.get()
+            try:
+                if not future.done():
+                    result = await loop.run_in_executor(self.pool, _render_in_worker, *args)
+                    self.stats["rendered"] += 1
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def render(self, etag, args) -> bytes:
+        """etag 为 None 时每次都重新渲染，不缓存也不与其他请求合并"""
+        future = None
+        if etag is not None:
+            cached = self._results.get(etag)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return cached
+            future = self._inflight.get(etag)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((args, future))
+            except asyncio.QueueFull:
+                self.stats["rejected"] += 1
+                raise HTTPError(429, "渲染队列已满，请稍后重试")
+            if etag is not None:
+                self._inflight[etag] = future
+                future.add_done_callback(lambda _: self._inflight.pop(etag, None))
+        result = await asyncio.shield(future)
+        if etag is not None and len(result) <= MAX_CACHED_RESULT_BYTES:
+            self._results.put(etag, result)
+        return result
+
+    async def handle_request(self, method, path, headers, body):
+        """返回 (status, headers, body)"""
+        path = path.split("?", 1)[0]
+        if path == "/healthz":
+            if method != "GET":
+                raise HTTPError(405)
+            status = dict(self.stats, queued=self.queue.qsize(), queue_size=self.queue_size,
+                          workers=self.workers)
+            return 200, {"Content-Type": "application/json"}, json.dumps(status).encode("utf-8")
+        if path == "/themes":
+            if method != "GET":
+                raise HTTPError(405)
+            themes = {key: theme["name"] for key, theme in THEMES.items()}
+            return 200, {"Content-Type": "application/json; charset=utf-8"}, json.dumps(
+                themes, ensure_ascii=False).encode("utf-8")
+        if path != "/render":
+            raise HTTPError(404)
+        if method != "POST":
+            raise HTTPError(405)
+
+        args = parse_render_request(body)
+        if args[3] not in THEMES:
+            raise HTTPError(400, f"未知主题: {args[3]}")
+        markdown = args[0]
+        if markdown is None and not get_content_backend().deterministic:
+            # 每次生成的内容可能不同，不能按请求参数缓存
+            html = await self.render(None, args)
+            return 200, {"Content-Type": "text/html; charset=utf-8", "Cache-Control": "no-store"}, html
+        # 主题配置和渲染器版本也参与计算，修改主题或升级后旧的 ETag 自动失效
+        etag = '"%s"' % content_hash("render", *args, THEMES[args[3]], renderer_version())[:32]
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            self.stats["not_modified"] += 1
+            return 304, response_headers, b""
+        html = await self.render(etag, args)
+        response_headers["Content-Type"] = "text/html; charset=utf-8"
+        return 200, response_headers, html
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._write_response(writer, e.status, {}, e.message.encode("utf-8"), False)
+                    break
+                if request is None:
+                    break
+                method, path, version, headers, body = request
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    if version == "HTTP/1.1"
+                    else headers.get("connection", "").lower() == "keep-alive"
+                )
+                try:
+                    status, response_headers, response_body = await self.handle_request(
+                        method, path, headers, body
+                    )
+                except HTTPError as e:
+                    status, response_headers, response_body = e.status, {}, e.message.encode("utf-8")
+                    if e.status == 429:
+                        response_headers["Retry-After"] = "1"
+                except Exception:
+                    logger.exception("渲染失败: %s %s", method, path)
+                    status, response_headers, response_body = 500, {}, b"render failed"
+                await self._write_response(writer, status, response_headers, response_body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HTTPError(400)
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "请求头过大")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413)
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path, version, headers, body
+
+    async def _write_response(self, writer, status, headers, body, keep_alive):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        headers = dict(headers)
+        headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+        headers["Content-Length"] = str(len(body))
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host, port, workers=None, queue_size=None):
+    service = RenderService(workers, queue_size)
+    await service.start()
+    server = await asyncio.start_server(
+        service.handle_connection, host, port, limit=MAX_HEADER_BYTES
+    )
+    logger.info("渲染服务已启动: http://%s:%s (workers=%s, queue=%s)",
+                host, port, service.workers, service.queue_size)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="演示文稿渲染 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="渲染进程数，默认等于 CPU 核数")
+    parser.add_argument("--queue-size", type=int, default=None, help="等待队列长度，默认为进程数的 4 倍")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# 缓存目录和检索索引在导入模块时读取，测试使用独立的临时目录
+_CACHE_DIR = tempfile.mkdtemp(prefix="ppt-test-cache-")
+os.environ["PPT_CACHE_DIR"] = _CACHE_DIR
+os.environ["PPT_SEARCH_INDEX"] = os.path.join(_CACHE_DIR, "search_index.sqlite3")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,20 @@
+import re
+
+import moffee_tool_v1 as m
+
+
+def test_flowchart_arrow_markers_are_unique_per_diagram():
+    first = m.render_mermaid("graph TD\nA --> B")
+    second = m.render_mermaid("graph LR\nC --> D")
+    ids = [re.search(r'<marker id="([^"]+)"', svg).group(1) for svg in (first, second)]
+    assert ids[0] != ids[1]
+    for svg, marker in zip((first, second), ids):
+        assert f'marker-end="url(#{marker})"' in svg
+
+
+def test_unsupported_diagram_falls_back_to_code_block():
+    rendered = m.render_mermaid("sequenceDiagram\nA->>B: hi")
+    assert rendered.startswith('<pre class="highlight">')
+    assert 'class="mermaid"' not in rendered and "A-&gt;&gt;B: hi" in rendered
+    assert not m.mermaid_is_static("sequenceDiagram\nA->>B: hi")
+    assert m.mermaid_is_static("pie\n\"a\" : 1")
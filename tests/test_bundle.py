@@ -0,0 +1,40 @@
+import hashlib
+import zipfile
+
+import pytest
+
+import moffee_tool_v1 as m
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+@pytest.fixture
+def decks(tmp_path):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "img" / "logo.png").write_bytes(PNG)
+    (tmp_path / "a.md").write_text(
+        "# 甲\n\n## 图片\n\n![logo](img/logo.png)\n\n![远程](https://example.com/x.png)\n",
+        encoding="utf-8")
+    (tmp_path / "b.md").write_text(
+        '# 乙\n\n## 图片\n\n<img src="img/logo.png" alt="logo">\n\n![缺失](img/missing.png)\n',
+        encoding="utf-8")
+    return [str(tmp_path / "a.md"), str(tmp_path / "b.md")]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_bundle_rewrites_local_images(tmp_path, decks, compact):
+    out = tmp_path / "bundle.zip"
+    m.export_bundle(decks, str(out), compact=compact, builder=m.DeckBuilder())
+    asset = f"assets/{hashlib.sha256(PNG).hexdigest()[:16]}.png"
+    with zipfile.ZipFile(out) as archive:
+        names = archive.namelist()
+        a = archive.read("decks/a.html").decode("utf-8")
+        b = archive.read("decks/b.html").decode("utf-8")
+        assert archive.read(asset) == PNG
+    # 两个演示文稿引用同一张图片，包内只存一份
+    assert [name for name in names if name.endswith(".png")] == [asset]
+    assert f"../{asset}" in a and "img/logo.png" not in a
+    assert f"../{asset}" in b and "img/logo.png" not in b
+    # 远程图片和找不到的文件保持原样
+    assert "https://example.com/x.png" in a
+    assert "img/missing.png" in b
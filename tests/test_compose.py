@@ -0,0 +1,133 @@
+import dataclasses
+import os
+import time
+
+import pytest
+
+import moffee_tool_v1 as m
+
+
+def chunk_tree(chunk):
+    return (chunk.type, chunk.paragraph, chunk.direction, [chunk_tree(c) for c in chunk.children or []])
+
+
+def page_summary(pages):
+    return [
+        (page.h1, page.h2, page.h3, page.raw_md, dataclasses.asdict(page.option), chunk_tree(page.chunk))
+        for page in pages
+    ]
+
+
+def long_document():
+    sections = []
+    for i in range(48):
+        body = "\n".join(f"- 第 {i} 节要点 {j}：" + "内容" * 20 for j in range(20))
+        # 部分页面没有标题，沿用上一页的标题，包括跨段的情况
+        sections.append(f"## 第 {i} 节\n\n{body}" if i % 3 else body)
+    return "---\nlayout: content\n---\n# 长文档\n\n" + "\n\n---\n\n".join(sections) + "\n"
+
+
+def test_composite_parallel_matches_composite():
+    document = long_document()
+    content, _ = m.parse_frontmatter(document)
+    target_chars = max(len(content) // 4, m.PARALLEL_COMPOSE_MIN_SEGMENT_CHARS)
+    assert len(m.split_document_segments(content, target_chars)) >= 2
+    assert page_summary(m.composite_parallel(document, workers=2)) == page_summary(m.composite(document))
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    # 保证修改时间变化，不依赖文件系统的时间精度
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_deck_builder_include_and_rebuild(tmp_path):
+    write(tmp_path / "main.md", "# 主文档\n\n## 开头\n\n- 一\n\n<!-- include: parts/a.md -->\n\n## 结尾\n\n- 二\n")
+    (tmp_path / "parts").mkdir()
+    write(tmp_path / "parts" / "a.md", "---\nlayout: centered\n---\n## 引用\n\n- 甲\n")
+    write(tmp_path / "other.md", "# 其他\n\n## 页\n\n- 丙\n")
+
+    builder = m.DeckBuilder()
+    build = builder.build(str(tmp_path / "main.md"))
+    other = builder.build(str(tmp_path / "other.md"))
+    assert [page.h2 for page in build.pages] == ["开头", "引用", "结尾"]
+    # 按文件分段拆分的结果与整体拆分展开后的文档相同，被引用文件的 front matter 被忽略
+    assert page_summary(build.pages) == page_summary(m.composite(build.document))
+    assert build.pages[1].option.layout != "centered"
+    assert [os.path.basename(source) for source in build.sources] == ["main.md", "a.md", "main.md"]
+    assert build.files == {str(tmp_path / "main.md"), str(tmp_path / "parts" / "a.md")}
+
+    assert builder.rebuild_changed() == {}
+    write(tmp_path / "parts" / "a.md", "## 引用\n\n- 乙\n")
+    rebuilt = builder.rebuild_changed()
+    assert list(rebuilt) == [build.path]
+    assert rebuilt[build.path].pages[1].raw_md == "- 乙"
+    assert builder.build(other.path).pages[0].raw_md == "- 丙"
+
+
+def test_deck_builder_rejects_include_cycles(tmp_path):
+    write(tmp_path / "a.md", "# A\n\n<!-- include: b.md -->\n")
+    write(tmp_path / "b.md", "## B\n\n<!-- include: a.md -->\n")
+    with pytest.raises(m.IncludeError, match="循环引用"):
+        m.DeckBuilder().build(str(tmp_path / "a.md"))
+
+
+def test_deck_builder_keeps_decorator_after_include_with_previous_segment(tmp_path):
+    # 分页线后紧跟的装饰行作用于下一页，include 之后的段不能单独拆分
+    write(tmp_path / "main.md", "# 标题\n\n<!-- include: part.md -->\n\n@(layout=centered)\n\n### 小节\n\n- 内容\n")
+    write(tmp_path / "part.md", "## 第一节\n")
+    build = m.DeckBuilder().build(str(tmp_path / "main.md"))
+    assert page_summary(build.pages) == page_summary(m.composite(build.document))
+    assert [(page.h3, page.option.layout) for page in build.pages] == [
+        (None, "content"), (None, "content"), ("小节", "centered")
+    ]
+    assert [os.path.basename(source) for source in build.sources] == ["main.md", "part.md", "main.md"]
+
+
+def slide_deck(count, edited=None):
+    slides = []
+    for i in range(count):
+        mark = "（已修改）" if i == edited else ""
+        body = "\n".join(f"- 第 {i} 页要点 {j}{mark}" for j in range(5))
+        # 部分页面带装饰行或没有标题
+        slides.append(("@(layout=centered)\n\n" if i % 7 == 3 else "") + (f"## 第 {i} 页\n\n{body}" if i % 5 else body))
+    return "---\nlayout: content\n---\n# 演示文稿\n\n" + "\n\n---\n\n".join(slides) + "\n"
+
+
+def test_deck_builder_edit_recomposes_only_nearby_segments(tmp_path, monkeypatch):
+    write(tmp_path / "deck.md", slide_deck(300))
+    builder = m.DeckBuilder()
+    build = builder.build(str(tmp_path / "deck.md"))
+    assert page_summary(build.pages) == page_summary(m.composite(build.document))
+
+    calls = []
+    composite = m.composite
+    monkeypatch.setattr(m, "composite", lambda document: calls.append(document) or composite(document))
+    write(tmp_path / "deck.md", slide_deck(300, edited=150))
+    build = builder.rebuild_changed()[build.path]
+    assert page_summary(build.pages) == page_summary(composite(build.document))
+    # 修改一张幻灯片最多影响它所在的段和相邻的段
+    assert 1 <= len(calls) <= 2 and all(len(document) < len(build.document) // 4 for document in calls)
+
+
+def test_watch_rebuild_of_300_slides_is_under_100ms(tmp_path):
+    # 监视模式下保存后的重建 + 渲染 + 发布，目标 100 ms 以内
+    write(tmp_path / "deck.md", slide_deck(300))
+    builder = m.DeckBuilder()
+    build = builder.build(str(tmp_path / "deck.md"))
+    server = m.LiveReloadServer(port=0)
+    server.serve_in_background()
+    try:
+        server.publish(m.render_pages(build.pages, title=build.title))
+        timings = []
+        for edited in range(3):
+            write(tmp_path / "deck.md", slide_deck(300, edited=edited * 100))
+            started = time.perf_counter()
+            build = builder.rebuild_changed()[build.path]
+            server.publish(m.render_pages(build.pages, title=build.title))
+            timings.append(time.perf_counter() - started)
+    finally:
+        server.close()
+    assert page_summary(build.pages) == page_summary(m.composite(build.document))
+    assert min(timings) < 0.1, timings
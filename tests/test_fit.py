@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import moffee_tool_v1 as m
+
+
+@pytest.mark.parametrize("bullets", [4, 8, 12, 16])
+def test_fit_scale_makes_estimated_content_fit(bullets):
+    # 每行 48 个汉字，缩放比例不同时折行数不同，逐次代入求比例会在两个值之间来回
+    body = "\n".join("- " + "机器学习" * 12 for _ in range(bullets))
+    pages = m.compose_document(f"# 标题\n\n## 小节\n\n{body}\n")
+    [scale] = m.compute_fit_scales(pages)
+    needed, available = m._fit_measure(pages)(np.array([scale]))
+    assert needed[0] * scale <= available[0] or scale == m.MIN_FIT_SCALE
+    # 取的是能放下的最大比例
+    if scale < 1:
+        larger = min(scale + 0.01, 1.0)
+        needed, available = m._fit_measure(pages)(np.array([larger]))
+        assert needed[0] * larger > available[0]
+
+
+def test_short_slide_is_not_scaled():
+    pages = m.compose_document("# 标题\n\n## 小节\n\n- 一\n- 二\n")
+    assert m.compute_fit_scales(pages) == [1.0]
@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("fontTools")
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
+
+import moffee_tool_v1 as m
+
+
+def build_font(path, family, codepoints):
+    names = [".notdef"] + [f"u{cp:04X}" for cp in codepoints]
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(names)
+    builder.setupCharacterMap({cp: f"u{cp:04X}" for cp in codepoints})
+    glyphs = {}
+    for name in names:
+        pen = TTGlyphPen(None)
+        pen.moveTo((50, 0))
+        pen.lineTo((50, 700))
+        pen.lineTo((500, 700))
+        pen.lineTo((500, 0))
+        pen.closePath()
+        glyphs[name] = pen.glyph()
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics({name: (1000, 50) for name in names})
+    builder.setupHorizontalHeader(ascent=880, descent=-120)
+    builder.setupNameTable({"familyName": family, "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(str(path))
+
+
+@pytest.fixture
+def font_dir(tmp_path, monkeypatch):
+    ascii_codepoints = list(range(0x20, 0x7F))
+    # 标题字体只有“人工”两个汉字，正文字体没有汉字，都要由补充字体补齐
+    build_font(tmp_path / "heading.ttf", "Test Heading", ascii_codepoints + [ord("人"), ord("工")])
+    build_font(tmp_path / "body.ttf", "Test Body", ascii_codepoints)
+    build_font(tmp_path / "cjk.ttf", "Noto Sans CJK SC", ascii_codepoints + list(range(0x4E00, 0x9FA6)))
+    monkeypatch.setattr(m, "FONT_DIRS", [str(tmp_path)])
+    monkeypatch.setitem(m.THEMES, "font-test", {
+        **m.THEMES["default"],
+        "fonts": {"heading": "'Test Heading', sans-serif", "body": "'Test Body', sans-serif"},
+    })
+    m.get_font_catalog.clear()
+    yield tmp_path
+    m.get_font_catalog.clear()
+
+
+def embedded_fonts(css, tmp_path):
+    """把 CSS 中的 data URI 字体解码，返回 {字族名: 覆盖的码点}"""
+    import base64
+    import re
+
+    fonts = {}
+    for family, data in re.findall(r'font-family: "([^"]+)";.*?base64,([A-Za-z0-9+/=]+)', css):
+        path = tmp_path / f"{len(fonts)}.font"
+        path.write_bytes(base64.b64decode(data))
+        fonts[family] = set(TTFont(str(path)).getBestCmap())
+    return fonts
+
+
+def test_fallback_font_covers_body_and_heading_characters(font_dir):
+    fragments = m.render_slide_fragments(m.compose_document("# 人工智能\n\n正文 机器学习"), "font-test")
+    css, report = m.embedded_font_css("font-test", fragments)
+
+    fonts = embedded_fonts(css, font_dir)
+    cjk = {cp for cp in m.collect_deck_codepoints(fragments) if cp >= 0x4E00}
+    assert cjk <= fonts["Noto Sans CJK SC"]
+    assert {ord("人"), ord("工")} <= fonts["Test Heading"]
+    assert report["missing"] == ""
+    assert '--body-font: "Test Body", "Noto Sans CJK SC", sans-serif;' in css
+    assert '--heading-font: "Test Heading", "Noto Sans CJK SC", sans-serif;' in css
+
+
+def test_subset_only_contains_requested_characters(font_dir):
+    data, flavor, covered = m.subset_font(str(font_dir / "cjk.ttf"), -1, {ord("机"), ord("器"), 0x1F600})
+    assert covered == {ord("机"), ord("器")}
+    path = font_dir / f"subset.{flavor}"
+    path.write_bytes(data)
+    assert set(TTFont(str(path)).getBestCmap()) == {ord("机"), ord("器")}
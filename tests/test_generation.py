@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import moffee_tool_v1 as m
+
+SECTIONS = [m.OutlineSection("第一节"), m.OutlineSection("第二节", "细节"), m.OutlineSection("第三节")]
+
+
+class ScriptedBackend(m.ContentBackend):
+    """按节记录调用次数，behavior(节, 第几次调用) 决定这一次的行为"""
+
+    def __init__(self, behavior):
+        self.behavior = behavior
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def outline(self, topic, num_slides):
+        return topic, SECTIONS[:num_slides]
+
+    def expand(self, topic, title, section):
+        with self.lock:
+            attempt = self.calls[section] = self.calls.get(section, 0) + 1
+        return self.behavior(section, attempt)
+
+
+def test_timed_out_attempt_is_retried():
+    def behavior(section, attempt):
+        if section == SECTIONS[1] and attempt == 1:
+            time.sleep(1.0)  # 第一次尝试卡住
+            return "- 太迟了"
+        return f"- {section.heading} 第 {attempt} 次"
+
+    backend = ScriptedBackend(behavior)
+    bodies = m.expand_outline(backend, "主题", "标题", SECTIONS, timeout=0.2, retries=1)
+    assert bodies == ["- 第一节 第 1 次", "- 第二节 第 2 次", "- 第三节 第 1 次"]
+    assert backend.calls[SECTIONS[1]] == 2
+
+
+def test_failure_after_retries_raises():
+    def behavior(section, attempt):
+        if section == SECTIONS[2]:
+            raise ValueError("后端出错")
+        return "- 正文"
+
+    backend = ScriptedBackend(behavior)
+    with pytest.raises(m.ContentGenerationError, match="第三节") as excinfo:
+        m.expand_outline(backend, "主题", "标题", SECTIONS, timeout=5, retries=2)
+    assert isinstance(excinfo.value.__cause__, ValueError)
+    assert backend.calls[SECTIONS[2]] == 3
+
+
+def test_queue_time_does_not_count_towards_timeout():
+    # 节数是线程数的四倍，排在后面的节等待的时间超过 timeout，但每次执行都不超时
+    sections = [m.OutlineSection(f"第 {i} 节") for i in range(m.GENERATION_WORKERS * 4)]
+    backend = ScriptedBackend(lambda section, attempt: time.sleep(0.15) or f"- {section.heading}")
+    progress = []
+    bodies = m.expand_outline(backend, "主题", "标题", sections, timeout=0.4, retries=0,
+                              progress=lambda done, total: progress.append((done, total)))
+    assert bodies == [f"- {section.heading}" for section in sections]
+    assert set(backend.calls.values()) == {1}
+    assert progress[-1] == (len(sections), len(sections))
+
+
+def test_section_bodies_stay_on_one_slide():
+    backend = ScriptedBackend(lambda section, attempt: "## 小标题\n\n- 要点\n\n---\n\n```\n# 注释\n```")
+    [body] = m.expand_outline(backend, "主题", "标题", SECTIONS[:1], timeout=5)
+    assert body == "**小标题**\n\n- 要点\n\n\n```\n# 注释\n```"
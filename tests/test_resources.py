@@ -0,0 +1,28 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import moffee_tool_v1 as m
+
+
+def test_shared_resource_is_created_once_and_cleared():
+    created = []
+
+    @m.shared_resource
+    def get_resource(name):
+        created.append(name)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        resources = list(pool.map(lambda _: get_resource("a"), range(32)))
+    assert len(set(map(id, resources))) == 1 and created == ["a"]
+    assert get_resource("b") is not resources[0]
+    get_resource.clear()
+    assert get_resource("a") is not resources[0]
+    assert created == ["a", "b", "a"]
+
+
+def test_background_threads_do_not_warn(caplog):
+    with caplog.at_level(logging.WARNING):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(m.render_slide_fragments, m.compose_document("# 标题\n\n## 页\n\n- 内容\n")).result()
+    assert not [record for record in caplog.records if record.name.startswith("streamlit")]
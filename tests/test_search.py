@@ -0,0 +1,83 @@
+import moffee_tool_v1 as m
+
+
+def test_records_strip_markup():
+    pages = m.compose_document(
+        '# 标题\n\n## 小节\n\n<img src="logo.png"\n     alt="标志">\n\n- **机器学习** &amp; [深度学习](https://example.com)\n'
+    )
+    [(number, section, heading, body)] = m.slide_search_records(pages)
+    assert (number, section, heading) == (1, "标题 / 小节", "标题 / 小节")
+    assert body == "机器学习 & 深度学习"
+
+
+def test_snippet_maps_normalized_offsets():
+    # "㍿" 规范化后变为四个字，摘要仍从原文中命中位置附近截取
+    body = "㍿" * 30 + "机器学习"
+    assert m.search_snippet(body, "机器学习", width=4) == "…㍿㍿机器学习"
+
+
+def test_generated_decks_are_keyed_by_content(tmp_path):
+    index = m.SearchIndex(str(tmp_path / "search.sqlite3"))
+    first = m.compose_document("# 主题\n\n## 第一版\n\n- 神经网络\n")
+    second = m.compose_document("# 主题\n\n## 第二版\n\n- 神经网络\n")
+    for pages in (first, second):
+        index.add_deck(m.deck_index_key(pages, "主题"), "主题", pages, "生成: 主题")
+    assert {hit.section for hit in index.search("神经网络")} == {"主题 / 第一版", "主题 / 第二版"}
+
+
+def build_index(tmp_path, decks):
+    index = m.SearchIndex(str(tmp_path / "search.sqlite3"))
+    for key, document in decks.items():
+        index.add_deck(key, m.extract_title(document), m.compose_document(document), key)
+    return index
+
+
+def test_cjk_queries_match_contiguous_phrases(tmp_path):
+    index = build_index(tmp_path, {
+        "a.md": "# 人工智能\n\n## 方法\n\n- 机器学习的基本方法\n\n## 应用\n\n- 语音识别\n",
+        # 含有“机器”“器学”“学习”三个相邻两字，但“机器学习”并不连续出现
+        "b.md": "# 教育\n\n## 校园\n\n- 机器学生一起学习\n",
+    })
+    assert [(hit.deck, hit.number) for hit in index.search("机器学习")] == [("a.md", 1)]
+    assert {hit.deck for hit in index.search("学习")} == {"a.md", "b.md"}
+    # 单个字也能命中
+    assert [(hit.deck, hit.number) for hit in index.search("语")] == [("a.md", 2)]
+    assert index.search("深度学习") == []
+
+
+def test_queries_normalize_width_and_case(tmp_path):
+    index = build_index(tmp_path, {"c.md": "# 概览\n\n## ＡＩ 产品\n\n- Streamlit 界面\n"})
+    assert [hit.number for hit in index.search("ai")] == [1]
+    assert [hit.number for hit in index.search("ＳＴＲＥＡＭＬＩＴ")] == [1]
+    # 标题命中的权重高于正文
+    [hit] = index.search("产品")
+    assert hit.section == "概览 / ＡＩ 产品" and hit.score > 0
+
+
+def test_reindexing_unchanged_deck_is_a_no_op(tmp_path):
+    pages = m.compose_document("# 标题\n\n## 页\n\n- 内容\n")
+    index = m.SearchIndex(str(tmp_path / "search.sqlite3"))
+    assert index.add_deck("d.md", "标题", pages)
+    assert not index.add_deck("d.md", "标题", pages)
+    assert index.stats()["decks"] == 1
+    assert index.remove_deck("d.md") and index.search("内容") == []
+
+
+def test_only_opted_in_renders_update_the_index(tmp_path):
+    def indexed(query):
+        m.get_index_executor().submit(lambda: None).result()
+        return [hit.source for hit in m.get_search_index().search(query)]
+
+    m.render_jinja2("# 无状态\n\n## 页\n\n- 渲染服务专用词\n")
+    assert indexed("渲染服务专用词") == []
+    deck = tmp_path / "deck.md"
+    deck.write_text("# 文件\n\n## 页\n\n- 命令行专用词\n", encoding="utf-8")
+    m.render_deck_file(str(deck), builder=m.DeckBuilder())
+    assert indexed("命令行专用词") == [str(deck)]
+
+
+def test_search_hits_are_escaped_for_markdown():
+    text = '<img src=x onerror="alert(1)"> **粗体** [链接](javascript:alert(1)) $x$ `代码`'
+    rendered = m.md(m.escape_markdown(text))
+    assert "<img" not in rendered and "<strong>" not in rendered and "<a " not in rendered
+    assert "<code>" not in rendered and "&lt;img" in rendered
@@ -0,0 +1,11 @@
+import moffee_tool_v1 as m
+
+
+def test_page_meta_is_a_hashable_mapping():
+    pages = m.compose_document("# 一\n\n## 甲\n\n内容\n\n## 乙\n\n内容\n")
+    first, second = m.retrieve_structure(pages)["page_meta"]
+    assert first == {"h1": "一", "h2": "甲", "h3": None}
+    assert dict(second) == {"h1": "一", "h2": "乙", "h3": None}
+    assert second.get("h2") == "乙" and second.get("h4", "-") == "-"
+    assert list(first.keys()) == ["h1", "h2", "h3"] and "h3" in first
+    assert len({first, second, m.PageMeta("一", "甲", None)}) == 2